@@ -4,15 +4,6 @@ import hashlib
 import hmac
 from config import get_settings
 
-settings = get_settings()
-
-# Admin secret key - should be set in environment variables
-# Generate a strong secret: openssl rand -hex 32
-ADMIN_SECRET_KEY = getattr(settings, 'admin_secret_key', None)
-
-# Admin user email (optional - for double verification)
-ADMIN_EMAIL = getattr(settings, 'admin_email', None)
-
 
 def verify_admin_key(
     x_admin_key: Annotated[Optional[str], Header()] = None,
@@ -26,7 +17,17 @@ def verify_admin_key(
     - X-Admin-Key: The admin secret key
     - X-Admin-ID: Your admin ID (can be your email or a unique identifier)
     """
-    if not ADMIN_SECRET_KEY:
+    # Read on use (settings are cached) so importing this module stays cheap
+    settings = get_settings()
+    
+    # Admin secret key - should be set in environment variables
+    # Generate a strong secret: openssl rand -hex 32
+    admin_secret_key = settings.admin_secret_key
+    
+    # Admin user email (optional - for double verification)
+    admin_email = settings.admin_email
+    
+    if not admin_secret_key:
         raise HTTPException(
             status_code=500,
             detail="Admin authentication not configured. Please set ADMIN_SECRET_KEY in environment variables."
@@ -39,14 +40,14 @@ def verify_admin_key(
         )
     
     # Verify the admin key matches
-    if not hmac.compare_digest(x_admin_key, ADMIN_SECRET_KEY):
+    if not hmac.compare_digest(x_admin_key, admin_secret_key):
         raise HTTPException(
             status_code=403,
             detail="Invalid admin credentials. Access denied."
         )
     
     # Optional: Verify admin email if configured
-    if ADMIN_EMAIL and x_admin_id != ADMIN_EMAIL:
+    if admin_email and x_admin_id != admin_email:
         raise HTTPException(
             status_code=403,
             detail="Admin ID does not match authorized admin email."
@@ -1,9 +1,66 @@
 from fastapi import HTTPException, Header
-from typing import Annotated, Optional
+from collections import OrderedDict
+from typing import Annotated, Optional, Tuple
+import hashlib
+import threading
+import time
 import jwt
 from config import get_settings
 
-settings = get_settings()
+# Verified tokens: sha256(token) -> (exp, user_id). Tokens are reused for up to an
+# hour, so repeat requests skip signature verification until the token expires.
+_token_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+_jwks_client: Optional[jwt.PyJWKClient] = None
+
+
+def get_jwks_client() -> jwt.PyJWKClient:
+    """JWKS client for Supabase asymmetric signing keys (keys cached in memory)"""
+    global _jwks_client
+    if _jwks_client is None:
+        settings = get_settings()
+        jwks_url = settings.supabase_jwks_url or f"{settings.supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json"
+        _jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True, lifespan=settings.jwks_cache_seconds)
+    return _jwks_client
+
+
+def _cached_user(digest: str) -> Optional[str]:
+    with _token_cache_lock:
+        entry = _token_cache.get(digest)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _token_cache[digest]
+            return None
+        _token_cache.move_to_end(digest)
+        return entry[1]
+
+
+def _cache_user(digest: str, exp: float, user_id: str) -> None:
+    with _token_cache_lock:
+        _token_cache[digest] = (exp, user_id)
+        _token_cache.move_to_end(digest)
+        while len(_token_cache) > get_settings().jwt_cache_max_entries:
+            _token_cache.popitem(last=False)
+
+
+def _decode_token(token: str) -> dict:
+    """Verify the signature with the shared secret (HS256) or the project's JWKS"""
+    algorithm = jwt.get_unverified_header(token).get("alg")
+    if algorithm in ASYMMETRIC_ALGORITHMS:
+        key = get_jwks_client().get_signing_key_from_jwt(token).key
+        algorithms = [algorithm]
+    else:
+        key = get_settings().supabase_jwt_secret
+        algorithms = ["HS256"]
+    return jwt.decode(
+        token,
+        key,
+        algorithms=algorithms,
+        options={"verify_aud": False}  # Supabase doesn't use audience claim
+    )
 
 
 def verify_jwt(authorization: Annotated[Optional[str], Header()] = None) -> str:
@@ -16,23 +73,28 @@ def verify_jwt(authorization: Annotated[Optional[str], Header()] = None) -> str:
         raise HTTPException(status_code=401, detail="Invalid authorization header format")
     
     token = authorization.split(" ")[1]
-    
+    digest = hashlib.sha256(token.encode()).hexdigest()
+
+    cached_user_id = _cached_user(digest)
+    if cached_user_id:
+        return cached_user_id
+
     try:
-        # Decode JWT token using Supabase JWT secret
-        decoded = jwt.decode(
-            token,
-            settings.supabase_jwt_secret,
-            algorithms=["HS256"],
-            options={"verify_aud": False}  # Supabase doesn't use audience claim
-        )
-        
+        decoded = _decode_token(token)
+
         # Extract user_id from 'sub' claim
         user_id = decoded.get("sub")
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token: missing user ID")
         
+        # Only tokens with an expiry are cached (until that expiry)
+        if decoded.get("exp"):
+            _cache_user(digest, float(decoded["exp"]), user_id)
+
         return user_id
         
+    except HTTPException:
+        raise
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError as e:
@@ -0,0 +1,102 @@
+"""
+Cold-start benchmark for the Vercel entry point (api/index.py).
+
+Each run imports api/index.py in a fresh interpreter, the way a new
+serverless instance does, and times the import. The import must do no
+network I/O, so placeholder credentials are used when none are set.
+Exits non-zero when the median exceeds --max-ms, so it can gate CI:
+
+    python -m benchmarks.cold_start [--runs 10] [--max-ms 1000] [--profile]
+
+--profile prints the slowest modules from `python -X importtime`.
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = Path(__file__).resolve().parents[2] / "api"
+
+# Placeholders for required settings; real values are never contacted at import
+PLACEHOLDER_ENV = {
+    "SUPABASE_URL": "https://example.supabase.co",
+    "SUPABASE_SERVICE_ROLE_KEY": "placeholder",
+    "RAZORPAY_KEY_ID": "placeholder",
+    "RAZORPAY_KEY_SECRET": "placeholder",
+    "FRONTEND_URL": "http://localhost:3000",
+}
+
+CHILD_SCRIPT = f"""
+import json, sys, time
+sys.path.insert(0, {str(API_DIR)!r})
+start = time.perf_counter()
+import index
+elapsed_ms = (time.perf_counter() - start) * 1000
+# index.py defines a fallback handler when `from server import app` fails; only Mangum means success
+ok = type(getattr(index, "handler", None)).__name__ == "Mangum" and "server" in sys.modules
+print(json.dumps({{"ms": elapsed_ms, "ok": ok, "modules": len(sys.modules)}}))
+"""
+
+
+def child_env() -> dict:
+    return {**PLACEHOLDER_ENV, **os.environ}
+
+
+def run_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        capture_output=True, text=True, env=child_env(), cwd=API_DIR, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def profile(top: int = 15) -> None:
+    """Print the modules with the largest cumulative import time"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {str(API_DIR)!r}); import index"],
+        capture_output=True, text=True, env=child_env(), cwd=API_DIR,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of api/index.py")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=1000.0, help="Fail if the median import exceeds this")
+    parser.add_argument("--profile", action="store_true", help="Show the slowest imports")
+    args = parser.parse_args()
+
+    run_once()  # Warm the bytecode cache so every timed run starts from .pyc files
+    samples = [run_once() for _ in range(args.runs)]
+    if not all(sample["ok"] for sample in samples):
+        print("FAIL: api/index.py fell back to its error handler (importing server failed)")
+        return 1
+
+    timings = sorted(sample["ms"] for sample in samples)
+    median = statistics.median(timings)
+    p95 = timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))]
+    print(f"api/index.py import: median {median:.1f} ms, p95 {p95:.1f} ms, "
+          f"min {timings[0]:.1f} ms over {args.runs} runs ({samples[0]['modules']} modules loaded)")
+
+    if args.profile:
+        profile()
+
+    if median > args.max_ms:
+        print(f"FAIL: median {median:.1f} ms exceeds budget of {args.max_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
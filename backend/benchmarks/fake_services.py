@@ -0,0 +1,560 @@
+"""
+In-process stand-ins for Supabase (PostgREST) and Razorpay.
+
+FakeSupabaseTransport is an httpx transport that answers PostgREST requests
+from in-memory tables, so the real server.app and the real supabase-py
+client run unchanged with no network. It implements the subset of PostgREST
+this backend uses: column selection with embedded relations, horizontal
+filters (eq, neq, gt, gte, lt, lte, in, is, like, ilike, not., or/and
+trees), order, limit/offset, exact counts, single-object responses,
+insert/upsert/update/delete with return=representation, and the checkout
+and inventory RPCs from supabase_setup.sql. Each request sleeps `rtt`
+seconds so round trips cost something, as they do against a real project.
+
+FakeRazorpayClient replaces razorpay.Client for order creation and signature
+checks, with the same simulated round trip.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+import asyncio
+import copy
+import json
+import re
+import time
+import uuid
+import httpx
+
+# Primary keys, and generated columns filled in on insert
+PRIMARY_KEYS = {"idempotency_keys": "key"}
+GENERATED_ID_TABLES = {"orders", "order_items", "contact_messages"}
+
+# Embeddable relations: (table, embedded) -> (local column, remote column, returns a list)
+RELATIONS = {
+    ("orders", "order_items"): ("id", "order_id", True),
+    ("order_items", "orders"): ("order_id", "id", False),
+    ("order_items", "products"): ("product_id", "id", False),
+    ("products", "order_items"): ("id", "product_id", True),
+}
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+# ---------------------------------------------------------------------------
+# Query parsing
+# ---------------------------------------------------------------------------
+
+def split_top_level(text: str, separator: str = ",") -> List[str]:
+    """Split on separator outside parentheses and double quotes"""
+    parts, depth, quoted, escaped, current = [], 0, False, False, []
+    for char in text:
+        if escaped:
+            current.append(char)
+            escaped = False
+            continue
+        if char == "\\" and quoted:
+            current.append(char)
+            escaped = True
+            continue
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == separator and depth == 0 and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    if current:
+        parts.append("".join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def unquote_value(value: str) -> str:
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def parse_select(select: str) -> List[Tuple[str, Optional[str], Optional[list]]]:
+    """'*, items:order_items(id, products(name))' -> [(name, alias, nested)]"""
+    columns = []
+    for part in split_top_level(select or "*"):
+        alias = None
+        if ":" in part.split("(", 1)[0]:
+            alias, part = part.split(":", 1)
+        if "(" in part:
+            name, inner = part.split("(", 1)
+            name = name.split("!", 1)[0].strip()
+            columns.append((name, alias, parse_select(inner.rsplit(")", 1)[0])))
+        else:
+            columns.append((part.strip(), alias, None))
+    return columns
+
+
+def coerce(cell: Any, raw: str) -> Any:
+    """Interpret a filter literal with the type of the stored value"""
+    if raw == "null":
+        return None
+    if isinstance(cell, bool):
+        return raw.lower() == "true"
+    if isinstance(cell, (int, float)):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def compare(op: str, cell: Any, raw: str) -> bool:
+    if op == "is":
+        target = {"null": None, "true": True, "false": False}.get(raw.lower(), raw)
+        return cell is target
+    if op == "in":
+        values = [unquote_value(v) for v in split_top_level(raw.strip("()"))]
+        return any(cell == coerce(cell, v) or str(cell) == v for v in values)
+    if op in ("like", "ilike"):
+        if cell is None:
+            return False
+        pattern = "^" + re.escape(raw).replace("\\*", ".*").replace("%", ".*") + "$"
+        return re.match(pattern, str(cell), re.IGNORECASE if op == "ilike" else 0) is not None
+    if cell is None:
+        return False
+    value = coerce(cell, raw)
+    if isinstance(cell, (int, float)) and not isinstance(value, (int, float)):
+        cell = str(cell)
+    if op == "eq":
+        return cell == value
+    if op == "neq":
+        return cell != value
+    if op == "gt":
+        return cell > value
+    if op == "gte":
+        return cell >= value
+    if op == "lt":
+        return cell < value
+    if op == "lte":
+        return cell <= value
+    raise PostgrestError(400, "PGRST100", f"Unsupported operator {op}")
+
+
+def parse_condition(expression: str) -> Callable[[dict], bool]:
+    """'col.op.value', 'not.col.op.value', 'or(...)', 'and(...)' -> predicate"""
+    negate = False
+    if expression.startswith("not."):
+        negate, expression = True, expression[4:]
+    for logic in ("or", "and"):
+        if expression.startswith(f"{logic}("):
+            predicate = parse_logic(logic, expression[len(logic):])
+            return (lambda row: not predicate(row)) if negate else predicate
+    column, op, raw = expression.split(".", 2)
+    if op == "not":
+        negate = not negate
+        op, raw = raw.split(".", 1)
+    raw = unquote_value(raw)
+    return lambda row: compare(op, row.get(column), raw) != negate
+
+
+def parse_logic(logic: str, body: str) -> Callable[[dict], bool]:
+    predicates = [parse_condition(part) for part in split_top_level(body.strip()[1:-1])]
+    combine = any if logic == "or" else all
+    return lambda row: combine(p(row) for p in predicates)
+
+
+def parse_filters(params: httpx.QueryParams) -> List[Callable[[dict], bool]]:
+    predicates = []
+    for key, value in params.multi_items():
+        if key in RESERVED_PARAMS:
+            continue
+        if key in ("or", "and", "not.or", "not.and"):
+            predicate = parse_logic(key.split(".")[-1], value)
+            predicates.append((lambda p: lambda row: not p(row))(predicate) if key.startswith("not.") else predicate)
+        else:
+            predicates.append(parse_condition(f"{key}.{value}"))
+    return predicates
+
+
+def sort_rows(rows: List[dict], orders: List[str]) -> List[dict]:
+    terms = []
+    for order in orders:
+        terms.extend(split_top_level(order))
+    for term in reversed(terms):
+        column, *modifiers = term.split(".")
+        desc = "desc" in modifiers
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=desc)
+        # PostgreSQL default: nulls last for asc, first for desc
+        rows = (missing + present) if desc else (present + missing)
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Fake PostgREST
+# ---------------------------------------------------------------------------
+
+class FakeSupabase:
+    """In-memory tables plus the backend's RPCs"""
+
+    def __init__(self):
+        self.tables: Dict[str, List[dict]] = {
+            "products": [], "orders": [], "order_items": [], "profiles": [],
+            "contact_messages": [], "idempotency_keys": [],
+        }
+        self.requests = 0
+        self._indexes: Dict[Tuple[str, str], Dict[Any, List[dict]]] = {}
+
+    # -- helpers -----------------------------------------------------------
+
+    def table(self, name: str) -> List[dict]:
+        if name not in self.tables:
+            raise PostgrestError(404, "42P01", f'relation "public.{name}" does not exist')
+        return self.tables[name]
+
+    def lookup(self, table: str, column: str, value: Any) -> List[dict]:
+        """Rows with table.column == value, through an index kept until the next write"""
+        index = self._indexes.get((table, column))
+        if index is None:
+            index = {}
+            for row in self.tables[table]:
+                index.setdefault(row.get(column), []).append(row)
+            self._indexes[(table, column)] = index
+        return index.get(value, [])
+
+    def project(self, table: str, row: dict, columns) -> dict:
+        result: Dict[str, Any] = {}
+        for name, alias, nested in columns:
+            if nested is None:
+                if name == "*":
+                    result.update(row)
+                else:
+                    result[alias or name] = row.get(name)
+                continue
+            relation = RELATIONS.get((table, name))
+            if relation is None:
+                raise PostgrestError(400, "PGRST200", f"Could not find a relationship between '{table}' and '{name}'")
+            local, remote, many = relation
+            matches = self.lookup(name, remote, row.get(local))
+            embedded = [self.project(name, match, nested) for match in matches]
+            result[alias or name] = embedded if many else (embedded[0] if embedded else None)
+        return result
+
+    def select_rows(self, table: str, params: httpx.QueryParams) -> List[dict]:
+        predicates = parse_filters(params)
+        rows = self.table(table)
+        # Narrow with an index on the first equality filter, like a primary/foreign key index
+        for key, value in params.multi_items():
+            if key not in RESERVED_PARAMS and "." not in key and value.startswith("eq.") and rows:
+                sample = next((r[key] for r in rows if r.get(key) is not None), None)
+                if isinstance(sample, str):
+                    rows = self.lookup(table, key, value[3:])
+                    break
+        rows = [r for r in rows if all(p(r) for p in predicates)]
+        orders = params.get_list("order")
+        if orders:
+            rows = sort_rows(rows, orders)
+        return rows
+
+    def fill_defaults(self, table: str, row: dict) -> dict:
+        row = dict(row)
+        if table in GENERATED_ID_TABLES and not row.get("id"):
+            row["id"] = str(uuid.uuid4())
+        for column in ("created_at", "updated_at"):
+            if row.get(column) in (None, "now()"):
+                row[column] = now_iso()
+        if table == "orders":
+            row.setdefault("status", "pending")
+            row.setdefault("payment_status", "pending")
+            row.setdefault("stock_released", False)
+        return row
+
+    # -- HTTP verbs --------------------------------------------------------
+
+    def get(self, table: str, params: httpx.QueryParams, prefer: str) -> Tuple[List[dict], Optional[int]]:
+        rows = self.select_rows(table, params)
+        total = len(rows) if "count=exact" in prefer else None
+        offset = int(params.get("offset", 0))
+        if "limit" in params:
+            rows = rows[offset:offset + int(params["limit"])]
+        elif offset:
+            rows = rows[offset:]
+        columns = parse_select(params.get("select", "*"))
+        return [self.project(table, row, columns) for row in rows], total
+
+    def insert(self, table: str, params: httpx.QueryParams, body: Any, prefer: str) -> List[dict]:
+        rows = self.table(table)
+        key = params.get("on_conflict") or PRIMARY_KEYS.get(table, "id")
+        merge = "resolution=merge-duplicates" in prefer
+        ignore = "resolution=ignore-duplicates" in prefer
+        inserted = []
+        for record in body if isinstance(body, list) else [body]:
+            existing = next((r for r in rows if key in record and r.get(key) == record[key]), None)
+            if existing is not None:
+                if ignore:
+                    continue
+                if not merge:
+                    raise PostgrestError(409, "23505", f'duplicate key value violates unique constraint "{table}_pkey"')
+                existing.update({k: (now_iso() if v == "now()" else v) for k, v in record.items()})
+                inserted.append(existing)
+                continue
+            row = self.fill_defaults(table, record)
+            rows.append(row)
+            inserted.append(row)
+        return inserted
+
+    def update(self, table: str, params: httpx.QueryParams, body: dict) -> List[dict]:
+        rows = self.select_rows(table, params)
+        for row in rows:
+            row.update({k: (now_iso() if v == "now()" else v) for k, v in body.items()})
+        return rows
+
+    def delete(self, table: str, params: httpx.QueryParams) -> List[dict]:
+        doomed = self.select_rows(table, params)
+        keys = {r.get("id") for r in doomed}
+        # Foreign keys as in supabase_setup.sql: order_items restrict products, cascade from orders
+        if table == "products" and any(i["product_id"] in keys for i in self.tables["order_items"]):
+            raise PostgrestError(409, "23503", 'update or delete on table "products" violates foreign key constraint')
+        if table == "orders":
+            self.tables["order_items"] = [i for i in self.tables["order_items"] if i["order_id"] not in keys]
+        doomed_ids = {id(r) for r in doomed}
+        self.tables[table] = [r for r in self.table(table) if id(r) not in doomed_ids]
+        return doomed
+
+    # -- RPCs --------------------------------------------------------------
+
+    def rpc(self, name: str, args: dict) -> Any:
+        handler = getattr(self, f"rpc_{name}", None)
+        if handler is None:
+            raise PostgrestError(404, "PGRST202", f"Could not find the function public.{name}")
+        return handler(**args)
+
+    def rpc_create_order_with_items(self, p_user_id: str, p_items: list, p_hold_minutes: int = 15) -> dict:
+        if not isinstance(p_items, list) or not p_items:
+            raise PostgrestError(400, "22023", "Order must contain at least one item")
+        products = {p["id"]: p for p in self.tables["products"]}
+        for item in p_items:
+            if item["product_id"] not in products:
+                raise PostgrestError(400, "P0002", f"Product {item['product_id']} not found")
+        wanted: Dict[str, int] = {}
+        for item in p_items:
+            wanted[item["product_id"]] = wanted.get(item["product_id"], 0) + item["quantity"]
+        for product_id in sorted(wanted):
+            if (products[product_id].get("stock_quantity") or 0) < wanted[product_id]:
+                raise PostgrestError(409, "PT409", f"Product {product_id} is out of stock")
+        for product_id, quantity in wanted.items():
+            products[product_id]["stock_quantity"] -= quantity
+            products[product_id]["updated_at"] = now_iso()
+        total = round(sum(products[i["product_id"]]["price"] * i["quantity"] for i in p_items), 2)
+        expires = datetime.now(timezone.utc) + timedelta(minutes=p_hold_minutes)
+        order = self.fill_defaults("orders", {
+            "user_id": p_user_id, "total_amount": total, "reservation_expires_at": expires.isoformat(),
+        })
+        self.tables["orders"].append(order)
+        for item in p_items:
+            self.tables["order_items"].append(self.fill_defaults("order_items", {
+                "order_id": order["id"], "product_id": item["product_id"], "quantity": item["quantity"],
+                "unit_price": products[item["product_id"]]["price"], "size": item.get("size"), "color": item.get("color"),
+            }))
+        return dict(order)
+
+    def rpc_release_order_stock(self, p_order_id: str, p_status: str = "cancelled") -> bool:
+        order = next((o for o in self.tables["orders"] if o["id"] == p_order_id), None)
+        if order is None or order.get("payment_status") == "paid" or order.get("stock_released"):
+            return False
+        order.update({"stock_released": True, "status": p_status, "updated_at": now_iso()})
+        products = {p["id"]: p for p in self.tables["products"]}
+        for item in self.tables["order_items"]:
+            if item["order_id"] == p_order_id and item["product_id"] in products:
+                products[item["product_id"]]["stock_quantity"] += item["quantity"]
+        return True
+
+    def rpc_reserve_order_stock(self, p_order_id: str) -> bool:
+        order = next((o for o in self.tables["orders"] if o["id"] == p_order_id), None)
+        if order is None or not order.get("stock_released"):
+            return True
+        products = {p["id"]: p for p in self.tables["products"]}
+        wanted: Dict[str, int] = {}
+        for item in self.tables["order_items"]:
+            if item["order_id"] == p_order_id:
+                wanted[item["product_id"]] = wanted.get(item["product_id"], 0) + item["quantity"]
+        if any((products[pid].get("stock_quantity") or 0) < qty for pid, qty in wanted.items() if pid in products):
+            return False
+        for pid, qty in wanted.items():
+            if pid in products:
+                products[pid]["stock_quantity"] -= qty
+        order.update({"stock_released": False, "updated_at": now_iso()})
+        return True
+
+    def rpc_release_expired_reservations(self, p_limit: int = 100) -> int:
+        now = now_iso()
+        expired = [
+            o for o in self.tables["orders"]
+            if o.get("payment_status") != "paid" and not o.get("stock_released")
+            and (o.get("reservation_expires_at") or now) < now
+        ][:p_limit]
+        return sum(1 for o in expired if self.rpc_release_order_stock(o["id"], "expired"))
+
+    def rpc_batch_update_products(self, p_updates: list) -> List[str]:
+        products = {p["id"]: p for p in self.tables["products"]}
+        updated = []
+        for change in p_updates:
+            product = products.get(change["id"])
+            if product is None:
+                continue
+            if change.get("price") is not None:
+                product["price"] = change["price"]
+            stock = change.get("stock_quantity")
+            if stock is None:
+                stock = product.get("stock_quantity") or 0
+            product["stock_quantity"] = max(stock + (change.get("stock_delta") or 0), 0)
+            product["updated_at"] = now_iso()
+            updated.append(product["id"])
+        return sorted(updated)
+
+    # -- dispatch ----------------------------------------------------------
+
+    def handle(self, method: str, path: str, params: httpx.QueryParams, headers: httpx.Headers, body: Any) -> httpx.Response:
+        self.requests += 1
+        if method != "GET":
+            self._indexes = {}
+        prefer = headers.get("prefer", "")
+        try:
+            resource = unquote(path.split("/rest/v1/", 1)[1])
+            total = None
+            if resource.startswith("rpc/"):
+                data = self.rpc(resource[4:], body or {})
+                return httpx.Response(200, json=data)
+            if method == "GET" or method == "HEAD":
+                data, total = self.get(resource, params, prefer)
+            elif method == "POST":
+                data = self.insert(resource, params, body, prefer)
+            elif method == "PATCH":
+                data = self.update(resource, params, body)
+            elif method == "DELETE":
+                data = self.delete(resource, params)
+            else:
+                raise PostgrestError(405, "PGRST117", f"Unsupported method {method}")
+
+            if method != "GET":
+                if "count=exact" in prefer:
+                    total = len(data)
+                columns = parse_select(params.get("select", "*"))
+                data = [self.project(resource, row, columns) for row in data]
+            data = copy.deepcopy(data)
+
+            response_headers = {}
+            if total is not None:
+                response_headers["content-range"] = f"0-{max(len(data) - 1, 0)}/{total}" if data else f"*/{total}"
+            if "application/vnd.pgrst.object+json" in headers.get("accept", ""):
+                if len(data) != 1:
+                    raise PostgrestError(406, "PGRST116", "JSON object requested, multiple (or no) rows returned")
+                return httpx.Response(200, json=data[0], headers=response_headers)
+            if method != "GET" and "return=minimal" in prefer:
+                return httpx.Response(204, headers=response_headers)
+            return httpx.Response(201 if method == "POST" else 200, json=data, headers=response_headers)
+        except PostgrestError as e:
+            return httpx.Response(e.status, json={"code": e.code, "message": e.message, "details": None, "hint": None})
+
+
+class FakeSupabaseTransport(httpx.AsyncBaseTransport):
+    """httpx transport routing PostgREST calls to a FakeSupabase"""
+
+    def __init__(self, fake: FakeSupabase, rtt: float = 0.002):
+        self.fake = fake
+        self.rtt = rtt
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        if "/rest/v1/" not in request.url.path:
+            return httpx.Response(404, json={"message": f"Not faked: {request.url.path}"})
+        raw = await request.aread()
+        body = json.loads(raw) if raw else None
+        return self.fake.handle(request.method, request.url.path, request.url.params, request.headers, body)
+
+
+# ---------------------------------------------------------------------------
+# Fake Razorpay
+# ---------------------------------------------------------------------------
+
+class _FakeOrders:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+
+    def create(self, data: dict, timeout: Any = None, **kwargs) -> dict:
+        time.sleep(self.rtt)  # Runs in the payments thread pool, like the real client
+        return {"id": f"order_{uuid.uuid4().hex[:14]}", "amount": data["amount"], "currency": data["currency"], "status": "created"}
+
+
+class _FakeUtility:
+    def verify_payment_signature(self, params: dict) -> bool:
+        return True
+
+    def verify_webhook_signature(self, body: str, signature: str, secret: str) -> bool:
+        return True
+
+
+class FakeRazorpayClient:
+    def __init__(self, rtt: float = 0.002):
+        self.order = _FakeOrders(rtt)
+        self.utility = _FakeUtility()
+
+
+# ---------------------------------------------------------------------------
+# Seed data
+# ---------------------------------------------------------------------------
+
+def seed(fake: FakeSupabase, products: int = 500, users: int = 20, orders_per_user: int = 25, items_per_order: int = 3) -> None:
+    """A catalog plus order history; stock is high enough that checkouts never run out"""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    categories = ["tees", "hoodies", "pants", "accessories"]
+    for i in range(products):
+        created = (start + timedelta(minutes=i)).isoformat()
+        fake.tables["products"].append({
+            "id": f"prod-{i:04d}",
+            "name": f"Product {i:04d}",
+            "description": "Heavyweight cotton, relaxed fit. " * 4,
+            "price": float(499 + (i * 37) % 2500),
+            "image_url": f"https://cdn.example.com/products/prod-{i:04d}.webp",
+            "image_variants": {str(w): f"https://cdn.example.com/products/prod-{i:04d}-{w}w.webp" for w in (320, 640, 1280)},
+            "category": categories[i % len(categories)],
+            "sizes": ["S", "M", "L", "XL"],
+            "colors": ["black", "white"],
+            "stock_quantity": 1_000_000,
+            "created_at": created,
+            "updated_at": created,
+        })
+    for u in range(users):
+        user_id = bench_user_id(u)
+        fake.tables["profiles"].append({"id": user_id, "email": f"user{u}@example.com", "full_name": f"User {u}", "avatar_url": None})
+        for o in range(orders_per_user):
+            created = (start + timedelta(hours=u * orders_per_user + o)).isoformat()
+            order_id = str(uuid.UUID(int=u * 100_000 + o + 1))
+            lines = [fake.tables["products"][(u * 7 + o * 3 + k) % products] for k in range(items_per_order)]
+            fake.tables["orders"].append({
+                "id": order_id, "user_id": user_id, "status": "completed", "payment_status": "paid",
+                "payment_id": f"pay_{o:06d}", "total_amount": round(sum(p["price"] for p in lines), 2),
+                "reservation_expires_at": None, "stock_released": False, "created_at": created, "updated_at": created,
+            })
+            for product in lines:
+                fake.tables["order_items"].append({
+                    "id": str(uuid.uuid4()), "order_id": order_id, "product_id": product["id"], "quantity": 1,
+                    "unit_price": product["price"], "size": "M", "color": "black", "created_at": created,
+                })
+
+
+def bench_user_id(index: int) -> str:
+    return str(uuid.UUID(int=0xBE7C4 << 64 | index))
@@ -0,0 +1,281 @@
+"""
+Endpoint benchmarks for the real server.app against in-process fakes.
+
+Every request goes through the full ASGI stack (middleware, auth, routing,
+validation, serialization) and the real supabase-py client, whose HTTP
+transport is replaced by FakeSupabaseTransport; Razorpay is replaced by
+FakeRazorpayClient. Nothing touches the network. Run from backend/:
+
+    python -m benchmarks.run                      # compare with baseline.json
+    python -m benchmarks.run --save-baseline      # record a new baseline
+    python -m benchmarks.run --scenarios checkout_5,order_history --requests 500
+
+For each scenario it reports throughput, p50/p95/p99 latency and Supabase
+round trips and bytes per request (from the X-DB-* debug headers). It exits
+non-zero when a scenario needs more round trips than its baseline, or when
+p95 latency or throughput is worse than the baseline by more than
+--threshold. Round-trip counts are exact and portable; latency baselines
+are only comparable on the machine that recorded them.
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# Fixed settings for a run; they replace anything in the environment or .env
+BENCH_ENV = {
+    "SUPABASE_URL": "https://bench.supabase.co",
+    "SUPABASE_SERVICE_ROLE_KEY": "bench-service-role-key",
+    "SUPABASE_JWT_SECRET": "bench-jwt-secret-0123456789abcdef0123456789",
+    "RAZORPAY_KEY_ID": "rzp_test_bench",
+    "RAZORPAY_KEY_SECRET": "bench-razorpay-secret",
+    "FRONTEND_URL": "http://localhost:3000",
+    "ADMIN_SECRET_KEY": "bench-admin-key",
+    "ADMIN_EMAIL": "bench-admin@example.com",
+    "DB_DEBUG_HEADERS": "true",
+    "DB_SLOW_QUERY_MS": "1000000",
+    "RESERVATION_SWEEP_INTERVAL_SECONDS": "0",
+    "WEBHOOK_DRAIN_INTERVAL_SECONDS": "0",
+    "WEBHOOK_QUEUE_PATH": os.path.join(tempfile.gettempdir(), "bench_webhooks.sqlite3"),
+    "IMAGE_PROCESSING_WORKERS": "0",
+}
+
+
+class Scenario:
+    def __init__(self, name: str, build: Callable[[int], Tuple[str, str, dict]], before: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.build = build    # request index -> (method, path, httpx kwargs)
+        self.before = before  # runs before every request, e.g. to empty the catalog cache
+
+
+def build_scenarios(fake, tokens: List[str]) -> Dict[str, Scenario]:
+    from catalog_cache import catalog_cache, order_cache
+
+    product_ids = [p["id"] for p in fake.tables["products"]]
+    admin = {"X-Admin-Key": BENCH_ENV["ADMIN_SECRET_KEY"], "X-Admin-ID": BENCH_ENV["ADMIN_EMAIL"]}
+    user_orders: Dict[str, List[str]] = {}
+    for order in fake.tables["orders"]:
+        user_orders.setdefault(order["user_id"], []).append(order["id"])
+    users = list(user_orders)
+
+    def auth(i: int) -> dict:
+        return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+    def checkout(lines: int) -> Callable[[int], Tuple[str, str, dict]]:
+        def build(i: int):
+            items = [
+                {"product_id": product_ids[(i * 13 + k * 7) % len(product_ids)], "quantity": 1, "size": "M", "color": "black"}
+                for k in range(lines)
+            ]
+            return "POST", "/api/payments/create-order", {"json": {"amount": 0, "items": items}, "headers": auth(i)}
+        return build
+
+    def admin_create(i: int):
+        product = {
+            "id": f"bench-{time.monotonic_ns()}-{i}", "name": f"Bench {i}", "description": "Benchmark product",
+            "price": 999.0, "category": "tees", "sizes": ["M"], "colors": ["black"], "stock_quantity": 10,
+        }
+        return "POST", "/api/admin/products", {"json": product, "headers": admin}
+
+    scenarios = [
+        Scenario("catalog_list", lambda i: ("GET", "/api/products?limit=50", {})),
+        Scenario("catalog_list_uncached", lambda i: ("GET", f"/api/products?limit=50&category={['tees', 'hoodies', 'pants', 'accessories'][i % 4]}", {}),
+                 before=catalog_cache.invalidate),
+        Scenario("product_detail_uncached", lambda i: ("GET", f"/api/products/{product_ids[i % len(product_ids)]}", {}),
+                 before=catalog_cache.invalidate),
+        Scenario("checkout_1", checkout(1)),
+        Scenario("checkout_5", checkout(5)),
+        Scenario("checkout_20", checkout(20)),
+        Scenario("order_history", lambda i: ("GET", "/api/orders", {"headers": auth(i)})),
+        Scenario("order_history_items", lambda i: ("GET", "/api/orders?include=items", {"headers": auth(i)})),
+        Scenario("order_detail", lambda i: ("GET", f"/api/orders/{user_orders[users[i % len(tokens)]][i % 10]}", {"headers": auth(i)})),
+        Scenario("order_detail_uncached", lambda i: ("GET", f"/api/orders/{user_orders[users[i % len(tokens)]][i % 10]}", {"headers": auth(i)}),
+                 before=order_cache.invalidate),
+        Scenario("admin_create_product", admin_create),
+        Scenario("admin_update_product", lambda i: ("PUT", f"/api/admin/products/{product_ids[i % len(product_ids)]}",
+                                                    {"json": {"price": float(500 + i % 100)}, "headers": admin})),
+        Scenario("admin_batch_update_100", lambda i: ("PATCH", "/api/admin/products", {"json": {"updates": [
+            {"id": product_ids[(i * 100 + n) % len(product_ids)], "changes": {"stock_delta": 5}} for n in range(100)
+        ]}, "headers": admin})),
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
+
+
+async def run_scenario(client, scenario: Scenario, requests: int, concurrency: int, warmup: int) -> dict:
+    latencies: List[float] = []
+    round_trips: List[int] = []
+    db_bytes: List[int] = []
+    errors: Dict[int, int] = {}
+    counter = iter(range(warmup + requests))
+
+    async def one(i: int, record: bool) -> None:
+        if scenario.before:
+            scenario.before()
+        method, path, kwargs = scenario.build(i)
+        start = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        elapsed = time.perf_counter() - start
+        if not record:
+            return
+        latencies.append(elapsed)
+        round_trips.append(int(response.headers.get("x-db-round-trips", 0)))
+        db_bytes.append(int(response.headers.get("x-db-bytes", 0)))
+        if response.status_code >= 400:
+            errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    for i in range(warmup):
+        await one(next(counter), record=False)
+
+    async def worker() -> None:
+        for i in counter:
+            await one(i, record=True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+
+    def pct(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(pct(0.50), 2),
+        "p95_ms": round(pct(0.95), 2),
+        "p99_ms": round(pct(0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "round_trips": round(statistics.fmean(round_trips), 2),
+        "db_bytes": round(statistics.fmean(db_bytes)),
+    }
+
+
+def compare(results: Dict[str, dict], baseline: dict, threshold: float) -> List[str]:
+    """Regressions against a stored baseline (empty if none)"""
+    problems = []
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        if result["round_trips"] > base["round_trips"] + 0.01:
+            problems.append(f"{name}: {result['round_trips']} round trips/request (baseline {base['round_trips']})")
+        if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            problems.append(f"{name}: p95 {result['p95_ms']} ms (baseline {base['p95_ms']} ms)")
+        if result["rps"] < base["rps"] * (1 - threshold):
+            problems.append(f"{name}: {result['rps']} req/s (baseline {base['rps']} req/s)")
+    return problems
+
+
+def print_table(results: Dict[str, dict], baseline: dict) -> None:
+    header = f"{'scenario':<26}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'trips':>7}{'db KB':>8}{'errors':>8}  vs baseline p95"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        delta = f"{(r['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}%" if base and base["p95_ms"] else "-"
+        errors = sum(r["errors"].values())
+        print(f"{name:<26}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['round_trips']:>7.2f}{r['db_bytes'] / 1024:>8.1f}{errors:>8}  {delta}")
+
+
+async def main_async(args) -> int:
+    os.environ.update(BENCH_ENV)
+    logging.disable(logging.CRITICAL if not args.verbose else logging.NOTSET)
+
+    import httpx
+    import jwt
+    import database
+    import payments
+    from benchmarks.fake_services import FakeSupabase, FakeSupabaseTransport, FakeRazorpayClient, seed, bench_user_id
+
+    fake = FakeSupabase()
+    seed(fake)
+    rtt = args.rtt_ms / 1000
+    fake_transport = FakeSupabaseTransport(fake, rtt=rtt)
+    database.init_supabase(transport=fake_transport)
+    payments._client = FakeRazorpayClient(rtt=rtt)
+
+    import server
+    from catalog_cache import catalog_cache, order_cache
+
+    expires = int(time.time()) + 3600
+    tokens = [
+        jwt.encode({"sub": bench_user_id(u), "exp": expires}, BENCH_ENV["SUPABASE_JWT_SECRET"], algorithm="HS256")
+        for u in range(20)
+    ]
+    scenarios = build_scenarios(fake, tokens)
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}. Available: {', '.join(scenarios)}")
+        return 2
+
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in selected:
+            # Every scenario starts from the same seeded data and empty caches
+            fake_transport.fake = FakeSupabase()
+            seed(fake_transport.fake)
+            catalog_cache.invalidate()
+            order_cache.invalidate()
+            results[name] = await run_scenario(client, scenarios[name], args.requests, args.concurrency, args.warmup)
+
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    print(f"{args.requests} requests per scenario, concurrency {args.concurrency}, simulated RTT {args.rtt_ms} ms\n")
+    print_table(results, baseline)
+
+    environment = {
+        "python": platform.python_version(), "machine": platform.machine(),
+        "requests": args.requests, "concurrency": args.concurrency, "rtt_ms": args.rtt_ms,
+    }
+    if args.save_baseline:
+        stored = baseline.get("scenarios", {}) if args.scenarios else {}
+        stored.update(results)
+        BASELINE_PATH.write_text(json.dumps({"environment": environment, "scenarios": stored}, indent=2) + "\n")
+        print(f"\nBaseline written to {BASELINE_PATH}")
+        return 0
+
+    failed = [name for name, r in results.items() if r["errors"]]
+    if failed:
+        print(f"\nFAIL: error responses in {', '.join(failed)}")
+        return 1
+    if baseline and baseline.get("environment") != environment:
+        print(f"\nNote: baseline was recorded with {baseline.get('environment')}; latency comparisons are approximate")
+    problems = compare(results, baseline, args.threshold)
+    if problems:
+        print("\nFAIL: regressions against baseline:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark API endpoints against in-process Supabase/Razorpay fakes")
+    parser.add_argument("--scenarios", help="Comma-separated scenario names (default: all)")
+    parser.add_argument("--requests", type=int, default=300, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="Simulated round trip to Supabase/Razorpay")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Allowed p95/throughput regression (0.5 = 50%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--verbose", action="store_true", help="Keep application logging on")
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
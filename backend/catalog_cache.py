@@ -0,0 +1,106 @@
+"""
+In-process cache for public catalog reads.
+
+Listing and single-product responses are kept in a bounded LRU with a TTL.
+Admin product writes call invalidate(), which clears every entry and bumps
+the catalog version. Each worker has its own cache, so the TTL bounds how
+long another worker can serve a catalog that was changed elsewhere.
+
+The same cache class also holds completed order details, keyed per user.
+"""
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+import hashlib
+import threading
+import time
+from config import get_settings
+
+settings = get_settings()
+
+_MISSING = object()
+
+
+class CatalogCache:
+    """Bounded LRU cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version = 1
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for key, or None on miss/expiry"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= now:
+                if entry is not _MISSING:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, version: Optional[int] = None) -> None:
+        """Store value unless the catalog changed since it was read (version mismatch)"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Drop every entry and bump the catalog version"""
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag for a serialized catalog response (same on every worker)"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against an ETag (weak comparison, RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+catalog_cache = CatalogCache(
+    ttl_seconds=settings.catalog_cache_ttl_seconds,
+    max_entries=settings.catalog_cache_max_entries,
+)
+
+# Completed orders never change; the short TTL bounds staleness of their embedded product fields
+order_cache = CatalogCache(
+    ttl_seconds=settings.order_cache_ttl_seconds,
+    max_entries=settings.order_cache_max_entries,
+)
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Optional
+from typing import List, Optional
 import os
 
 
@@ -10,12 +10,88 @@ class Settings(BaseSettings):
     supabase_service_role_key: str  # Required - no default (get from Supabase dashboard)
     supabase_jwt_secret: str = ""  # Optional
     supabase_anon_key: str = ""  # Optional
-    
+    # Asymmetric JWT signing keys (empty = <supabase_url>/auth/v1/.well-known/jwks.json)
+    supabase_jwks_url: str = ""
+    jwks_cache_seconds: int = 600
+    jwt_cache_max_entries: int = 10000  # Verified-token cache size per worker
+
+    # Supabase HTTP connection pool (shared by every request on a worker)
+    supabase_timeout_seconds: float = 10.0  # Per-call deadline for PostgREST/Storage requests
+    supabase_connect_timeout_seconds: float = 5.0
+    supabase_max_connections: int = 100
+    supabase_max_keepalive_connections: int = 20
+    supabase_keepalive_expiry_seconds: float = 30.0
+    supabase_http2: bool = True
+
+    # Per-request query accounting (see query_stats.py)
+    db_debug_headers: bool = False  # Add X-DB-Round-Trips / X-DB-Bytes / X-DB-Time-Ms
+    db_slow_query_ms: float = 500.0
+    db_repeated_query_threshold: int = 2  # Warn when one request hits a table this often
+
+    # Health checks: one cached readiness probe per interval, whatever the probe rate
+    health_probe_interval_seconds: float = 15.0
+    health_probe_timeout_seconds: float = 2.0
+
+    # Public catalog cache (per worker, invalidated by admin product writes)
+    catalog_cache_ttl_seconds: float = 60.0
+    catalog_cache_max_entries: int = 512
+    # Browsers revalidate every time (cheap 304s); the Vercel edge serves from its cache
+    catalog_cache_control: str = "public, max-age=0, s-maxage=60, stale-while-revalidate=300"
+
+    # Product image derivatives (WebP, resized in a process pool; 0 workers = thread)
+    image_derivative_widths: List[int] = [320, 640, 1280]
+    image_webp_quality: int = 80
+    image_processing_workers: int = 2
+
+    # Multipart image uploads
+    max_image_upload_bytes: int = 10 * 1024 * 1024
+    image_upload_chunk_bytes: int = 256 * 1024
+
+    # Inventory reservations (stock held by unpaid orders)
+    reservation_hold_minutes: int = 15
+    reservation_sweep_interval_seconds: float = 60.0  # 0 disables the in-process sweeper
+
+    # Product listing pagination
+    products_page_size: int = 100
+    products_max_page_size: int = 200
+
+    # Admin bulk import/export (see product_import.py)
+    product_import_chunk_size: int = 500  # Rows per upsert round trip
+    product_import_max_errors: int = 1000  # Row errors listed in the report
+    product_export_page_size: int = 1000
+    product_batch_max_updates: int = 1000  # Changes per PATCH /admin/products call
+
+    # Order history pagination
+    orders_page_size: int = 20
+    orders_max_page_size: int = 100
+    # Completed order details cached per worker (user_id + order_id)
+    order_cache_ttl_seconds: float = 120.0
+    order_cache_max_entries: int = 2048
+
     # Razorpay Configuration
     razorpay_key_id: str
     razorpay_key_secret: str
     razorpay_webhook_secret: str = "mock_webhook_secret"
-    
+    razorpay_webhook_allow_unsigned: bool = False  # Local development only, while no secret is set
+    # Gateway calls: timeouts, worker pool and circuit breaker
+    razorpay_connect_timeout_seconds: float = 3.0
+    razorpay_timeout_seconds: float = 8.0
+    razorpay_max_workers: int = 8  # Thread pool and HTTP connection pool size
+    razorpay_breaker_failure_threshold: int = 5
+    razorpay_breaker_reset_seconds: float = 30.0
+
+    # Idempotency-Key replay for checkout/payment POSTs ("memory" per worker, or "table")
+    idempotency_store: str = "memory"
+    idempotency_ttl_seconds: float = 24 * 60 * 60
+    idempotency_max_entries: int = 10000
+
+    # Webhook queue (SQLite WAL file; empty = next to the backend, /tmp on Vercel)
+    webhook_queue_path: str = ""
+    webhook_batch_size: int = 100
+    webhook_drain_interval_seconds: float = 1.0  # 0 disables the in-process worker
+    webhook_max_attempts: int = 5
+    webhook_retention_hours: int = 72  # How long processed event ids keep deduplicating
+
     # Frontend URL
     frontend_url: str
     
@@ -0,0 +1,198 @@
+"""
+Async Supabase data access layer.
+
+Every handler talks to Supabase through the AsyncClient created here, so
+PostgREST and Storage round trips are awaited instead of blocking the event
+loop. All sub-clients share one pooled, keep-alive HTTP/2 connection pool and
+each query runs under a per-call deadline via execute().
+
+Nothing is built at import time: the supabase and httpx packages (most of
+the cold-start import cost) are loaded and the client created on first use,
+or by the startup hook on long-running servers.
+"""
+from fastapi import HTTPException
+from typing import TYPE_CHECKING, Any, Optional
+import asyncio
+import logging
+import os
+import time
+from config import get_settings
+from metrics import observe_dependency
+from query_stats import record_query, record_response_bytes
+
+if TYPE_CHECKING:
+    import httpx
+    from supabase import AsyncClient
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Shared clients (created once per worker)
+supabase: Optional["AsyncClient"] = None
+supabase_error: Optional[str] = None
+_http_client: Optional["httpx.AsyncClient"] = None
+_init_attempted = False
+
+
+class DatabaseTimeoutError(Exception):
+    """Raised when a Supabase call does not complete within its deadline"""
+
+
+def is_vercel() -> bool:
+    return bool(os.getenv("VERCEL") == "1" or os.getenv("VERCEL_ENV"))
+
+
+def _build_http_client(transport: Any = None) -> "httpx.AsyncClient":
+    """Pooled HTTP client shared by the PostgREST and Storage clients"""
+    import httpx
+    return httpx.AsyncClient(
+        transport=transport,
+        http2=settings.supabase_http2,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=settings.supabase_max_connections,
+            max_keepalive_connections=settings.supabase_max_keepalive_connections,
+            keepalive_expiry=settings.supabase_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(
+            settings.supabase_timeout_seconds,
+            connect=settings.supabase_connect_timeout_seconds,
+        ),
+        event_hooks={"response": [record_response_bytes]},
+    )
+
+
+def init_supabase(transport: Any = None) -> Optional["AsyncClient"]:
+    """Create the shared Supabase client. Records a readable error instead of raising.
+    `transport` replaces the network (e.g. the in-process fake used by the benchmarks)."""
+    global supabase, supabase_error, _http_client, _init_attempted
+
+    _init_attempted = True
+    try:
+        # Validate Supabase URL
+        supabase_url = settings.supabase_url.strip() if settings.supabase_url else ""
+
+        if not supabase_url:
+            if is_vercel():
+                error_msg = "SUPABASE_URL is not set. Add it in Vercel project settings → Environment Variables."
+            else:
+                error_msg = "SUPABASE_URL is not set in environment variables. Please add it to backend/.env file"
+            logger.error(f"CONFIGURATION ERROR: {error_msg}")
+            supabase_error = error_msg
+            return None
+
+        if not settings.supabase_service_role_key:
+            if is_vercel():
+                error_msg = "SUPABASE_SERVICE_ROLE_KEY is not set. Add it in Vercel project settings → Environment Variables."
+            else:
+                error_msg = "SUPABASE_SERVICE_ROLE_KEY is not set in environment variables"
+            logger.error(f"CONFIGURATION ERROR: {error_msg}")
+            supabase_error = error_msg
+            return None
+
+        # Ensure URL has proper format
+        if not supabase_url.startswith("http://") and not supabase_url.startswith("https://"):
+            logger.warning("Supabase URL missing protocol, adding https://")
+            supabase_url = f"https://{supabase_url}"
+
+        # Validate URL format
+        if ".supabase.co" not in supabase_url:
+            logger.warning(f"Supabase URL might be incorrect: {supabase_url}")
+
+        from supabase import AsyncClient, AsyncClientOptions
+
+        logger.info(f"Connecting to Supabase: {supabase_url}")
+        _http_client = _build_http_client(transport)
+        options = AsyncClientOptions(
+            httpx_client=_http_client,
+            auto_refresh_token=False,
+            persist_session=False,
+        )
+        supabase = AsyncClient(supabase_url, settings.supabase_service_role_key, options)
+        supabase_error = None
+        return supabase
+
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"SUPABASE INITIALIZATION ERROR: {error_msg}")
+        supabase_error = f"Failed to initialize Supabase: {error_msg}"
+        # Don't raise - allow the app to start so we can return JSON errors
+        return None
+
+
+def get_supabase() -> Optional["AsyncClient"]:
+    """The shared client, created on first call (None if configuration is invalid)"""
+    if supabase is None and not _init_attempted:
+        init_supabase()
+    return supabase
+
+
+def get_http_client() -> Optional["httpx.AsyncClient"]:
+    """The pooled HTTP client, for raw Supabase REST calls (e.g. streamed uploads)"""
+    return _http_client
+
+
+async def close_supabase() -> None:
+    """Close the shared connection pool"""
+    if _http_client is not None:
+        await _http_client.aclose()
+
+
+def describe_query(query: Any) -> str:
+    """Low-cardinality label for a call, e.g. "GET products" or "POST rpc/create_order_with_items" """
+    config = getattr(query, "request", None)
+    if config is None or not hasattr(config, "path"):
+        return "storage"
+    method = getattr(config.http_method, "value", config.http_method)
+    return f"{method} {config.path.path.split('/rest/v1/', 1)[-1]}"
+
+
+async def execute(query: Any, timeout: Optional[float] = None) -> Any:
+    """Await a PostgREST query builder (or any awaitable call) with a deadline"""
+    deadline = timeout if timeout is not None else settings.supabase_timeout_seconds
+    awaitable = query.execute() if hasattr(query, "execute") else query
+    start = time.perf_counter()
+    ok = False
+    try:
+        result = await asyncio.wait_for(awaitable, timeout=deadline)
+        ok = True
+        return result
+    except asyncio.TimeoutError:
+        raise DatabaseTimeoutError(f"Database request timeout after {deadline}s")
+    finally:
+        elapsed = time.perf_counter() - start
+        operation = describe_query(query)
+        observe_dependency("supabase", operation, elapsed, ok)
+        record_query(operation, elapsed)
+
+
+async def check_connection() -> None:
+    """Run a minimal query to verify credentials and connectivity"""
+    global supabase_error
+    if get_supabase() is None:
+        return
+    try:
+        await execute(supabase.table("products").select("id").limit(1))
+        logger.info("✓ Supabase connection verified successfully")
+    except Exception as test_error:
+        error_str = str(test_error)
+        if "Invalid API key" in error_str or "401" in error_str or "unauthorized" in error_str.lower():
+            logger.error("✗ Invalid Supabase API key detected!")
+            supabase_error = "Invalid Supabase API key. Check SUPABASE_SERVICE_ROLE_KEY in Vercel environment variables."
+        else:
+            logger.warning(f"⚠ Supabase connection test failed: {error_str}")
+            logger.warning("The client is initialized but connection will be tested on first query")
+
+
+async def get_db() -> "AsyncClient":
+    """Dependency returning the shared Supabase client or a configuration error.
+    Async so FastAPI runs it on the event loop: no threadpool hop per request, and
+    the lazy first-call init cannot race across worker threads."""
+    if get_supabase() is None:
+        error_detail = supabase_error or "Supabase client not initialized"
+        if is_vercel():
+            detail_msg = f"Database not configured. {error_detail}. Please check your SUPABASE_SERVICE_ROLE_KEY in Vercel environment variables."
+        else:
+            detail_msg = f"Database not configured. {error_detail}. Please check your backend/.env file."
+        raise HTTPException(status_code=500, detail=detail_msg)
+    return supabase
@@ -0,0 +1,98 @@
+"""
+Cached database readiness for health checks.
+
+Probes never query Supabase themselves. A background task (long-running
+servers) refreshes the cached result every HEALTH_PROBE_INTERVAL_SECONDS;
+without one (serverless), a request that finds the result older than the
+interval triggers a single refresh that concurrent requests share. Either
+way the database sees at most one probe query per interval per worker, no
+matter how often monitors and load balancers call the endpoints.
+"""
+from typing import Optional
+import asyncio
+import logging
+import time
+from config import get_settings
+import database
+from database import execute
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class ReadinessProbe:
+    """Last known Supabase connectivity, refreshed at most once per interval"""
+
+    def __init__(self, interval_seconds: float, timeout_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.supabase = "unknown"  # connected | disconnected | not_initialized | unknown
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None  # Unix time of the last probe
+        self.latency_ms: Optional[float] = None
+        self._refresh: Optional[asyncio.Task] = None
+        self._background = False
+
+    @property
+    def age_seconds(self) -> Optional[float]:
+        return None if self.checked_at is None else time.time() - self.checked_at
+
+    @property
+    def ready(self) -> bool:
+        # A result older than a few intervals means the probe itself is stuck
+        age = self.age_seconds
+        return self.supabase == "connected" and age is not None and age <= 3 * self.interval_seconds
+
+    async def probe(self) -> None:
+        """Run one probe query and record the outcome"""
+        db = database.get_supabase()
+        start = time.perf_counter()
+        if db is None:
+            self.supabase, self.error = "not_initialized", database.supabase_error or "Supabase client not initialized"
+        else:
+            try:
+                await execute(db.table("products").select("id").limit(1), timeout=self.timeout_seconds)
+                self.supabase, self.error = "connected", None
+            except Exception as e:
+                if self.supabase != "disconnected":
+                    logger.warning(f"Readiness probe failed: {str(e)}")
+                self.supabase, self.error = "disconnected", str(e)[:200]  # Limit error message length
+        self.latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.checked_at = time.time()
+
+    async def current(self) -> "ReadinessProbe":
+        """The cached result, refreshed first if it is older than the interval.
+        Concurrent callers await the same refresh."""
+        age = self.age_seconds
+        if age is None or (age > self.interval_seconds and not self._background):
+            if self._refresh is None or self._refresh.done():
+                self._refresh = asyncio.ensure_future(self.probe())
+            await asyncio.shield(self._refresh)
+        return self
+
+    def snapshot(self) -> dict:
+        age = self.age_seconds
+        return {
+            "status": "ready" if self.ready else "not_ready",
+            "supabase": self.supabase,
+            "error": self.error,
+            "checked_at": self.checked_at,
+            "age_seconds": None if age is None else round(age, 1),
+            "probe_latency_ms": self.latency_ms,
+        }
+
+    async def run(self) -> None:
+        """Refresh the cached result periodically (long-running servers only)"""
+        self._background = True
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.warning(f"Readiness probe loop error: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+readiness = ReadinessProbe(
+    interval_seconds=settings.health_probe_interval_seconds,
+    timeout_seconds=settings.health_probe_timeout_seconds,
+)
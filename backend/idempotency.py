@@ -0,0 +1,191 @@
+"""
+Idempotency-Key support for retried POST requests.
+
+A client sends the same `Idempotency-Key` header when it retries a request.
+The first response for a key is stored and replayed for repeats, so retries
+never create a second order or call the payment gateway twice. Concurrent
+duplicates on the same worker wait for the in-flight request instead of
+running again; with the table store, a duplicate arriving at another worker
+while the first is still running gets a 409.
+
+Keys are scoped per user and endpoint. Reusing a key with a different
+request body is rejected with 422. Only successful responses are stored; a
+failed request releases its key so the client can retry it.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from config import get_settings
+from database import execute
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+
+class MemoryIdempotencyStore:
+    """Per-worker LRU of completed responses with a TTL"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        # In-process duplicates are coalesced by run_idempotent itself
+        return True
+
+    async def complete(self, key: str, fingerprint: str, response: Any) -> None:
+        record = {"status": "completed", "fingerprint": fingerprint, "response": response}
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, record)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def release(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+class TableIdempotencyStore:
+    """Shared store in the `idempotency_keys` table (see supabase_setup.sql).
+    A pending row claims the key across workers until the response is stored."""
+
+    def __init__(self, db: "AsyncClient", ttl_seconds: float):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+
+    async def get(self, key: str) -> Optional[dict]:
+        response = await execute(
+            self.db.table("idempotency_keys").select("status,fingerprint,response,expires_at").eq("key", key)
+        )
+        if not response.data:
+            return None
+        record = response.data[0]
+        if datetime.fromisoformat(record["expires_at"]) <= datetime.now(timezone.utc):
+            await self.release(key)
+            return None
+        return record
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        response = await execute(
+            self.db.table("idempotency_keys").upsert(
+                {"key": key, "fingerprint": fingerprint, "status": "pending", "expires_at": expires_at.isoformat()},
+                on_conflict="key",
+                ignore_duplicates=True,
+            )
+        )
+        return bool(response.data)
+
+    async def complete(self, key: str, fingerprint: str, response: Any) -> None:
+        await execute(
+            self.db.table("idempotency_keys")
+            .update({"status": "completed", "response": response})
+            .eq("key", key)
+        )
+
+    async def release(self, key: str) -> None:
+        await execute(self.db.table("idempotency_keys").delete().eq("key", key))
+
+
+_memory_store = MemoryIdempotencyStore(
+    ttl_seconds=settings.idempotency_ttl_seconds,
+    max_entries=settings.idempotency_max_entries,
+)
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def get_idempotency_store(db: "AsyncClient"):
+    if settings.idempotency_store == "table":
+        return TableIdempotencyStore(db, settings.idempotency_ttl_seconds)
+    return _memory_store
+
+
+def request_fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _replay(record: dict, fingerprint: str) -> Any:
+    if record.get("fingerprint") != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    if record.get("status") != "completed":
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+    return record["response"]
+
+
+async def run_idempotent(
+    db: "AsyncClient",
+    scope: str,
+    idempotency_key: Optional[str],
+    payload: Any,
+    handler: Callable[[], Awaitable[Any]],
+) -> Tuple[Any, bool]:
+    """Run handler once per (scope, key). Returns (response, replayed)."""
+    if not idempotency_key:
+        return await handler(), False
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+    key = f"{scope}:{idempotency_key}"
+    fingerprint = request_fingerprint(payload)
+    store = get_idempotency_store(db)
+
+    # Same worker, still running: wait for the original instead of repeating it
+    pending = _in_flight.get(key)
+    if pending is not None:
+        original_fingerprint, result = await asyncio.shield(pending)
+        if original_fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+        return result, True
+
+    record = await store.get(key)
+    if record is not None:
+        return _replay(record, fingerprint), True
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        if not await store.claim(key, fingerprint):
+            record = await store.get(key)
+            if record is None:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+            if record.get("status") == "completed":
+                # Waiters compare their own fingerprint; a mismatch is only this request's error
+                future.set_result((record.get("fingerprint"), record["response"]))
+            return _replay(record, fingerprint), True
+
+        try:
+            result = await handler()
+        except BaseException:
+            await store.release(key)
+            raise
+        await store.complete(key, fingerprint, result)
+        future.set_result((fingerprint, result))
+        return result, False
+    except BaseException as e:
+        if not future.done():
+            future.set_exception(e)
+            future.exception()  # Mark retrieved; waiters (if any) re-raise it
+        raise
+    finally:
+        _in_flight.pop(key, None)
@@ -0,0 +1,124 @@
+"""
+Move inline base64 product images into Supabase Storage.
+
+When a storage upload fails, handle_image_upload keeps the raw data URL in
+`products.image_url`, which bloats every catalog query. This job uploads
+those images (plus their WebP derivatives) to the product-images bucket and
+rewrites `image_url` and `image_variants` to the public URLs.
+
+The job is resumable: migrated rows stop matching the `data:image/%` filter,
+and rows that fail are skipped by resuming after their id. Run it from the
+admin endpoint (a bounded number of batches per call) or to completion from
+the command line:
+
+    python image_migration.py [--batch-size 20] [--dry-run]
+"""
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+import argparse
+import asyncio
+import json
+import logging
+from database import execute
+from images import decode_data_url, store_product_image
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+logger = logging.getLogger(__name__)
+
+
+async def _migrate_row(db: "AsyncClient", row: dict, dry_run: bool) -> Optional[int]:
+    """Upload one inline image and point the product at it. Returns bytes reclaimed."""
+    data_url = row["image_url"]
+    image_bytes, file_ext = decode_data_url(data_url)
+    if dry_run:
+        return len(data_url)
+    
+    public_url, variants = await store_product_image(db, image_bytes, file_ext)
+    if not public_url:
+        return None
+    
+    # Only rewrite rows that still hold an inline image (an admin may have replaced it meanwhile)
+    await execute(
+        db.table("products")
+        .update({"image_url": public_url, "image_variants": variants, "updated_at": datetime.utcnow().isoformat()})
+        .eq("id", row["id"])
+        .like("image_url", "data:image/%")
+    )
+    return len(data_url) - len(public_url)
+
+
+async def migrate_inline_images(
+    db: "AsyncClient",
+    batch_size: int = 20,
+    max_batches: Optional[int] = None,
+    after: Optional[str] = None,
+    dry_run: bool = False,
+) -> dict:
+    """Migrate inline images in id order, batch by batch.
+
+    Returns a report including `next_after`, the id to resume from, which is
+    None once every inline image has been processed.
+    """
+    report = {"scanned": 0, "migrated": 0, "failed": [], "bytes_reclaimed": 0, "dry_run": dry_run}
+    batches = 0
+    
+    while max_batches is None or batches < max_batches:
+        query = (
+            db.table("products")
+            .select("id,image_url")
+            .like("image_url", "data:image/%")
+            .order("id")
+            .limit(batch_size)
+        )
+        if after is not None:
+            query = query.gt("id", after)
+        response = await execute(query)
+        rows = response.data or []
+        if not rows:
+            after = None
+            break
+        
+        results = await asyncio.gather(
+            *(_migrate_row(db, row, dry_run) for row in rows),
+            return_exceptions=True,
+        )
+        for row, result in zip(rows, results):
+            report["scanned"] += 1
+            if isinstance(result, int):
+                report["migrated"] += 1
+                report["bytes_reclaimed"] += result
+            else:
+                if isinstance(result, Exception):
+                    logger.error(f"Image migration failed for product {row['id']}: {result}")
+                report["failed"].append(row["id"])
+        
+        after = rows[-1]["id"]
+        batches += 1
+        logger.info(f"Image migration batch {batches}: {report['migrated']} migrated, {report['bytes_reclaimed']} bytes reclaimed")
+        if len(rows) < batch_size:
+            after = None
+            break
+    
+    report["next_after"] = after
+    return report
+
+
+async def _main(batch_size: int, dry_run: bool) -> dict:
+    import database
+    db = await database.get_db()
+    try:
+        return await migrate_inline_images(db, batch_size=batch_size, dry_run=dry_run)
+    finally:
+        await database.close_supabase()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move inline base64 product images into Supabase Storage")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be migrated without uploading")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    print(json.dumps(asyncio.run(_main(args.batch_size, args.dry_run)), indent=2))
@@ -0,0 +1,330 @@
+"""
+Product image storage helpers.
+
+Images live in the public `product-images` Supabase Storage bucket. Inline
+base64 data URLs are only kept in `products.image_url` when the storage
+upload fails.
+
+Alongside each original, resized WebP derivatives are stored as
+`<name>-w<width>.webp` and exposed on the product as `image_variants`
+({"320": url, ...}) for use in `srcset`. Resizing runs in a process pool so
+it never blocks the event loop. Pillow is optional; without it only the
+original is stored.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import base64
+import io
+import logging
+import uuid
+from fastapi import Request, UploadFile
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from config import get_settings
+from database import execute, get_http_client
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+STORAGE_BUCKET = "product-images"
+
+# Leading bytes -> (content type, file extension)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", "png"),
+    (b"GIF87a", "image/gif", "gif"),
+    (b"GIF89a", "image/gif", "gif"),
+)
+
+
+class ImageTooLargeError(Exception):
+    """Raised while receiving an upload that exceeds max_image_upload_bytes"""
+
+
+class UnsupportedImageError(Exception):
+    """Raised when uploaded bytes are not a recognised image format"""
+
+
+# Room for multipart boundaries, part headers and small form fields around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+_executor: Optional[ProcessPoolExecutor] = None
+_process_pool_unavailable = False
+
+
+def is_data_url(image_url: Optional[str]) -> bool:
+    return bool(image_url) and image_url.startswith("data:image/")
+
+
+def decode_data_url(data_url: str) -> Tuple[bytes, str]:
+    """Parse data:image/png;base64,<data> into (bytes, file extension)"""
+    header, encoded = data_url.split(",", 1)
+    image_bytes = base64.b64decode(encoded)
+    file_ext = header.split(";")[0].split(":")[1].split("/")[1]
+    return image_bytes, file_ext
+
+
+def sniff_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """Detect the image format from its first bytes, ignoring any client-declared type"""
+    for signature, content_type, file_ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type, file_ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif", "avif"
+    return None
+
+
+def public_url_for(file_path: str) -> str:
+    # Get public URL - construct it manually since Supabase storage URL format is predictable
+    # Format: https://<project_ref>.supabase.co/storage/v1/object/public/<bucket>/<path>
+    project_ref = settings.supabase_url.split("//")[1].split(".")[0] if "//" in settings.supabase_url else "iojrjuicfhqemwvlvdev"
+    return f"https://{project_ref}.supabase.co/storage/v1/object/public/{STORAGE_BUCKET}/{file_path}"
+
+
+def render_derivatives(image_data: bytes, widths: Tuple[int, ...], quality: int) -> Dict[int, bytes]:
+    """Resize to each width (never upscaling) and encode as WebP. Runs in a worker process."""
+    from PIL import Image, ImageOps
+    
+    derivatives = {}
+    with Image.open(io.BytesIO(image_data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+        for width in sorted({min(width, image.width) for width in widths}):
+            if width == image.width:
+                resized = image
+            else:
+                resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, format="WEBP", quality=quality, method=4)
+            derivatives[width] = buffer.getvalue()
+    return derivatives
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    """Lazily start the resize pool. Returns None (thread fallback) where processes are unavailable."""
+    global _executor, _process_pool_unavailable
+    if _executor is None and settings.image_processing_workers > 0 and not _process_pool_unavailable:
+        try:
+            _executor = ProcessPoolExecutor(max_workers=settings.image_processing_workers)
+        except (OSError, NotImplementedError) as e:
+            # e.g. AWS Lambda/Vercel have no /dev/shm for multiprocessing semaphores
+            logger.warning(f"Process pool unavailable, resizing images in a thread: {e}")
+            _process_pool_unavailable = True
+    return _executor
+
+
+async def create_image_variants(image_data: bytes) -> Dict[int, bytes]:
+    """Render WebP derivatives off the event loop. Returns {} if Pillow is missing or decoding fails."""
+    global _executor
+    if not settings.image_derivative_widths or find_spec("PIL") is None:
+        return {}
+    
+    loop = asyncio.get_running_loop()
+    render = partial(render_derivatives, image_data, tuple(settings.image_derivative_widths), settings.image_webp_quality)
+    try:
+        try:
+            return await loop.run_in_executor(_get_executor(), render)
+        except BrokenProcessPool:
+            _executor = None
+            return await loop.run_in_executor(None, render)
+    except Exception as e:
+        logger.warning(f"Could not create image variants: {str(e)}")
+        return {}
+
+
+async def upload_image_to_supabase(
+    db: "AsyncClient",
+    image_data: bytes,
+    filename: str,
+    folder: str = "products",
+    file_path: Optional[str] = None
+) -> Optional[str]:
+    """Upload image to Supabase Storage and return public URL. Returns None if upload fails."""
+    try:
+        # Generate unique filename
+        file_ext = filename.split('.')[-1] if '.' in filename else 'jpg'
+        if file_path is None:
+            unique_filename = f"{uuid.uuid4()}.{file_ext}"
+            file_path = f"{folder}/{unique_filename}"
+        
+        # Upload to Supabase Storage
+        try:
+            await execute(db.storage.from_(STORAGE_BUCKET).upload(
+                file_path,
+                image_data,
+                file_options={"content-type": f"image/{file_ext}", "upsert": "true"}
+            ))
+        except Exception as storage_error:
+            logger.warning(f"Supabase storage upload failed: {str(storage_error)}. Using base64 data URL instead.")
+            # If storage fails, return None to use base64 data URL
+            return None
+        
+        return public_url_for(file_path)
+        
+    except Exception as e:
+        logger.error(f"Error uploading image to Supabase: {str(e)}")
+        # Return None instead of raising error - will use base64 data URL as fallback
+        return None
+
+
+async def stream_image_to_supabase(
+    db: "AsyncClient",
+    chunks: AsyncIterator[bytes],
+    file_path: str,
+    content_type: str,
+    content_length: Optional[int] = None
+) -> str:
+    """Stream an upload to Storage chunk by chunk through the pooled client.
+    Unlike upload_image_to_supabase, failures raise so the caller can report them."""
+    http_client = get_http_client()
+    if http_client is None:
+        raise RuntimeError("Supabase HTTP client not initialized")
+    
+    headers = {**db.options.headers, "content-type": content_type, "x-upsert": "true"}
+    if content_length is not None:
+        headers["content-length"] = str(content_length)
+    url = f"{str(db.storage_url).rstrip('/')}/object/{STORAGE_BUCKET}/{file_path}"
+    response = await execute(http_client.post(url, content=chunks, headers=headers))
+    response.raise_for_status()
+    return public_url_for(file_path)
+
+
+async def _upload_variants(db: "AsyncClient", stem: str, rendered: Dict[int, bytes]) -> Optional[Dict[str, str]]:
+    widths = list(rendered)
+    urls = await asyncio.gather(*(
+        upload_image_to_supabase(db, rendered[width], "variant.webp", file_path=f"{stem}-w{width}.webp")
+        for width in widths
+    ))
+    variants = {str(width): url for width, url in zip(widths, urls) if url}
+    return variants or None
+
+
+async def store_product_image(db: "AsyncClient", image_data: bytes, file_ext: str) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
+    """Upload the original and its WebP derivatives.
+    Returns (original URL, variants) or (None, None) if the original upload fails."""
+    stem = f"products/{uuid.uuid4()}"
+    original_url, rendered = await asyncio.gather(
+        upload_image_to_supabase(db, image_data, f"product.{file_ext}", file_path=f"{stem}.{file_ext}"),
+        create_image_variants(image_data),
+    )
+    if not original_url:
+        return None, None
+    return original_url, await _upload_variants(db, stem, rendered)
+
+
+async def receive_image_upload(request: Request, field: str = "file") -> Optional[UploadFile]:
+    """Parse a multipart image upload without accepting more than the size limit.
+
+    A declared Content-Length over the limit is refused before the body is
+    read, and a chunked body is cut off as soon as it passes the limit, so an
+    oversized upload is never spooled to disk in full. Raises
+    ImageTooLargeError; returns None if the form has no such file field.
+    """
+    limit = settings.max_image_upload_bytes + MULTIPART_OVERHEAD_BYTES
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise ImageTooLargeError(f"Image exceeds {settings.max_image_upload_bytes} bytes")
+    received = 0
+    
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise ImageTooLargeError(f"Image exceeds {settings.max_image_upload_bytes} bytes")
+        return message
+    
+    form = await Request(request.scope, receive).form(max_files=1)
+    file = form.get(field)
+    return file if isinstance(file, StarletteUploadFile) else None
+
+
+async def store_uploaded_image(db: "AsyncClient", file: UploadFile) -> dict:
+    """Copy a received upload (see receive_image_upload) to Storage in chunks,
+    then add its WebP derivatives.
+
+    The format is sniffed from the first chunk (the client's content type is
+    ignored) and the size limit is checked again while copying. Raises
+    UnsupportedImageError, ImageTooLargeError, or the storage error.
+    """
+    max_bytes = settings.max_image_upload_bytes
+    chunk_size = settings.image_upload_chunk_bytes
+    if file.size is not None and file.size > max_bytes:
+        raise ImageTooLargeError(f"Image exceeds {max_bytes} bytes")
+    
+    head = await file.read(chunk_size)
+    detected = sniff_image_type(head)
+    if detected is None:
+        raise UnsupportedImageError("Unsupported image type. Upload a JPEG, PNG, GIF, WebP or AVIF file.")
+    content_type, file_ext = detected
+    received = 0
+    
+    async def chunks() -> AsyncIterator[bytes]:
+        nonlocal received
+        chunk = head
+        while chunk:
+            received += len(chunk)
+            if received > max_bytes:
+                raise ImageTooLargeError(f"Image exceeds {max_bytes} bytes")
+            yield chunk
+            chunk = await file.read(chunk_size)
+    
+    stem = f"products/{uuid.uuid4()}"
+    image_url = await stream_image_to_supabase(db, chunks(), f"{stem}.{file_ext}", content_type, file.size)
+    
+    # Derivatives need the decoded image; re-read it from Starlette's spooled temp file
+    await file.seek(0)
+    rendered = await create_image_variants(await file.read())
+    image_variants = await _upload_variants(db, stem, rendered)
+    return {
+        "image_url": image_url,
+        "image_variants": image_variants,
+        "content_type": content_type,
+        "bytes": received,
+    }
+
+
+async def handle_image_upload(db: "AsyncClient", image_data: Optional[str] = None) -> dict:
+    """Handle image upload from base64 data URL or existing URL.
+    Returns the product columns to store: image_url and image_variants."""
+    if not image_data:
+        return {"image_url": None, "image_variants": None}
+    
+    # If it's already a URL, return it
+    if image_data.startswith("http://") or image_data.startswith("https://"):
+        return {"image_url": image_data, "image_variants": None}
+    
+    # If it's a base64 data URL, try to upload to storage, fallback to data URL
+    if is_data_url(image_data):
+        try:
+            image_bytes, file_ext = decode_data_url(image_data)
+            
+            # Try to upload to Supabase Storage
+            uploaded_url, variants = await store_product_image(db, image_bytes, file_ext)
+            
+            # If upload succeeded, return the storage URL
+            if uploaded_url:
+                return {"image_url": uploaded_url, "image_variants": variants}
+            
+            # If upload failed, return the original base64 data URL as fallback
+            logger.info("Using base64 data URL as fallback (storage upload failed)")
+            return {"image_url": image_data, "image_variants": None}
+            
+        except Exception as e:
+            logger.error(f"Error processing base64 image: {str(e)}")
+            # Return the original data URL as fallback instead of raising error
+            return {"image_url": image_data, "image_variants": None}
+    
+    # If format is unknown, return as-is (might be a valid URL without http/https)
+    logger.warning(f"Unknown image format, using as-is: {image_data[:50]}...")
+    return {"image_url": image_data, "image_variants": None}
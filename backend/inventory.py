@@ -0,0 +1,61 @@
+"""
+Stock reservations.
+
+create_order_with_items (supabase_setup.sql) reserves stock with a
+conditional decrement inside the checkout transaction. This module returns
+reserved stock when a payment fails or a pending order's hold expires, and
+takes it back (reserve_order_stock) when a payment arrives after the hold
+expired; if the stock is gone by then the order needs a refund instead. All
+stock arithmetic happens in Postgres; nothing here reads then writes.
+"""
+from typing import TYPE_CHECKING
+import asyncio
+import logging
+from config import get_settings
+from database import execute
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+async def release_order_stock(db: "AsyncClient", order_id: str, status: str = "cancelled") -> bool:
+    """Return an unpaid order's stock. False if it was paid or already released."""
+    response = await execute(db.rpc("release_order_stock", {"p_order_id": order_id, "p_status": status}))
+    return bool(response.data)
+
+
+async def reserve_order_stock(db: "AsyncClient", order_id: str) -> bool:
+    """Re-reserve the stock of an order whose hold was released. False if it is sold out."""
+    response = await execute(db.rpc("reserve_order_stock", {"p_order_id": order_id}))
+    return bool(response.data)
+
+
+async def settle_late_payment(db: "AsyncClient", order_id: str) -> str:
+    """Order status for a payment that arrived after the stock hold was released:
+    "completed" if the stock could be reserved again, else "needs_refund"."""
+    if await reserve_order_stock(db, order_id):
+        logger.info(f"Order {order_id} was paid after its hold expired; stock reserved again")
+        return "completed"
+    logger.warning(f"Order {order_id} was paid after its hold expired and is now out of stock; needs refund")
+    return "needs_refund"
+
+
+async def release_expired_reservations(db: "AsyncClient", limit: int = 100) -> int:
+    """Release holds of unpaid orders past reservation_expires_at. Returns the count."""
+    response = await execute(db.rpc("release_expired_reservations", {"p_limit": limit}))
+    return int(response.data or 0)
+
+
+async def run_reservation_sweeper(db: "AsyncClient", interval_seconds: float) -> None:
+    """Periodically release expired reservations (long-running servers only)"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            released = await release_expired_reservations(db)
+            if released:
+                logger.info(f"Released stock for {released} expired orders")
+        except Exception as e:
+            logger.warning(f"Reservation sweep failed: {str(e)}")
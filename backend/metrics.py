@@ -0,0 +1,164 @@
+"""
+In-process request and dependency metrics in Prometheus text format.
+
+MetricsMiddleware records a count per (method, route, status) and a latency
+histogram per (method, route), labelled with the route template
+(/api/products/{product_id}) rather than the raw path. database.execute()
+and the Razorpay gateway calls record their durations through
+observe_dependency(). Each latency series also keeps a sliding window of
+recent samples for p50/p95/p99.
+
+Metrics are per worker process; scrape every instance (or aggregate the
+histogram buckets) for fleet-wide numbers.
+"""
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Tuple
+import bisect
+import threading
+import time
+
+# Seconds; chosen around the API's 10s Supabase deadline
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW_SIZE = 1024  # Recent samples kept per series for quantiles
+
+
+class LatencySeries:
+    """Cumulative histogram plus a sliding window of recent samples"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.window: Deque[float] = deque(maxlen=WINDOW_SIZE)
+
+    def observe(self, seconds: float) -> None:
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        if index < len(self.bucket_counts):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.window.append(seconds)
+
+    def quantiles(self) -> Dict[float, float]:
+        samples = sorted(self.window)
+        if not samples:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.request_latency: Dict[Tuple[str, str], LatencySeries] = {}
+        self.dependency_errors: Dict[Tuple[str, str], int] = {}
+        self.dependency_latency: Dict[Tuple[str, str], LatencySeries] = {}
+        self._lock = threading.Lock()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        with self._lock:
+            key = (method, route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_latency.setdefault((method, route), LatencySeries()).observe(seconds)
+
+    def observe_dependency(self, service: str, operation: str, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self.dependency_latency.setdefault((service, operation), LatencySeries()).observe(seconds)
+            if not ok:
+                key = (service, operation)
+                self.dependency_errors[key] = self.dependency_errors.get(key, 0) + 1
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            lines: List[str] = [
+                "# HELP process_start_time_seconds Start time of this worker since the Unix epoch.",
+                "# TYPE process_start_time_seconds gauge",
+                f"process_start_time_seconds {self.started_at:.3f}",
+                "# HELP http_requests_total HTTP requests by method, route template and status.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+            _render_latency(
+                lines, "http_request_duration_seconds", "HTTP request latency",
+                (({"method": method, "route": route}, series) for (method, route), series in sorted(self.request_latency.items())),
+            )
+            lines += [
+                "# HELP dependency_errors_total Failed or timed out Supabase/Razorpay calls.",
+                "# TYPE dependency_errors_total counter",
+            ]
+            for (service, operation), count in sorted(self.dependency_errors.items()):
+                lines.append(f"dependency_errors_total{_labels(service=service, operation=operation)} {count}")
+            _render_latency(
+                lines, "dependency_duration_seconds", "Supabase and Razorpay call latency",
+                (({"service": service, "operation": operation}, series) for (service, operation), series in sorted(self.dependency_latency.items())),
+            )
+            return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _render_latency(lines: List[str], name: str, help_text: str, series_list: Iterable[Tuple[dict, LatencySeries]]) -> None:
+    """A histogram family (for aggregation) and a summary family with window quantiles"""
+    series_list = list(series_list)
+    lines += [f"# HELP {name} {help_text} (histogram).", f"# TYPE {name} histogram"]
+    for labels, series in series_list:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, series.bucket_counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=repr(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {series.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {series.total:.6f}")
+        lines.append(f"{name}_count{_labels(**labels)} {series.count}")
+
+    summary = name.replace("_duration_", "_latency_")
+    lines += [f"# HELP {summary} {help_text}, quantiles over the last {WINDOW_SIZE} calls.", f"# TYPE {summary} summary"]
+    for labels, series in series_list:
+        for quantile, value in series.quantiles().items():
+            lines.append(f"{summary}{_labels(**labels, quantile=repr(quantile))} {value:.6f}")
+        lines.append(f"{summary}_sum{_labels(**labels)} {series.total:.6f}")
+        lines.append(f"{summary}_count{_labels(**labels)} {series.count}")
+
+
+metrics = MetricsRegistry()
+
+
+def observe_dependency(service: str, operation: str, seconds: float, ok: bool = True) -> None:
+    metrics.observe_dependency(service, operation, seconds, ok)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its matched route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the shared scope; unmatched
+            # paths share one label so arbitrary URLs can't blow up cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.observe_request(scope["method"], route, status, time.perf_counter() - start)
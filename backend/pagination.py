@@ -0,0 +1,55 @@
+"""
+Keyset (cursor) pagination helpers for PostgREST queries.
+
+A cursor is an opaque, URL-safe token holding the sort column, sort value
+and id of the last row on a page. The next page is fetched with a row-value
+comparison pushed down into PostgREST, so page N costs the same as page 1
+(no OFFSET).
+"""
+from fastapi import HTTPException
+from typing import Any, List, Optional, Tuple
+import base64
+import json
+
+
+def encode_cursor(column: str, sort_value: Any, row_id: Any) -> str:
+    raw = json.dumps([column, sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, column: str) -> Tuple[Any, Any]:
+    """Decode a cursor produced by encode_cursor. Raises HTTP 400 if malformed
+    or if it was issued for a different sort column."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_column, sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    if cursor_column != column:
+        raise HTTPException(status_code=400, detail="Pagination cursor does not match the requested sort order")
+    return sort_value, row_id
+
+
+def quote_value(value: Any) -> str:
+    """Quote a value for use inside a PostgREST logical (or/and) filter"""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def apply_keyset(query: Any, column: str, desc: bool, cursor: Optional[str], tiebreaker: str = "id") -> Any:
+    """Order by (column, tiebreaker) and resume after the cursor position if given"""
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, column)
+        op = "lt" if desc else "gt"
+        value, last_id = quote_value(sort_value), quote_value(row_id)
+        query = query.or_(f"{column}.{op}.{value},and({column}.eq.{value},{tiebreaker}.{op}.{last_id})")
+    return query.order(column, desc=desc).order(tiebreaker, desc=desc)
+
+
+def paginate(rows: List[dict], limit: int, column: str, tiebreaker: str = "id") -> Tuple[List[dict], Optional[str]]:
+    """Trim a limit+1 result to one page and build the cursor for the next page"""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(column, last.get(column), last.get(tiebreaker))
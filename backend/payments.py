@@ -0,0 +1,144 @@
+"""
+Razorpay gateway access.
+
+One long-lived razorpay.Client (with a pooled requests session) is shared by
+the whole worker. Network calls run in a bounded thread pool with connect and
+read timeouts plus an overall deadline, so a slow gateway never blocks the
+event loop. A circuit breaker stops calling Razorpay after repeated failures;
+callers then fall straight into their mock-order path until it recovers.
+Signature checks are local HMAC computations and run inline.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Optional
+import asyncio
+import logging
+import threading
+import time
+from config import get_settings
+from metrics import observe_dependency
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_client: Any = None
+_client_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=settings.razorpay_max_workers, thread_name_prefix="razorpay")
+
+
+class RazorpayUnavailableError(Exception):
+    """Raised when Razorpay is not configured, not importable, or the circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures; after
+    `reset_seconds` one trial call is let through (half-open) and its outcome
+    closes or re-opens the circuit."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """End a half-open trial that finished without an outcome (e.g. it was cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Razorpay circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+razorpay_breaker = CircuitBreaker(
+    failure_threshold=settings.razorpay_breaker_failure_threshold,
+    reset_seconds=settings.razorpay_breaker_reset_seconds,
+)
+
+
+# Razorpay: lazy import to avoid pkg_resources issues on some hosts (e.g. Render)
+def get_razorpay_client():
+    """Return the shared Razorpay client or None if unavailable. Import is done here to allow app to start."""
+    global _client
+    if not getattr(settings, "razorpay_key_id", None) or not getattr(settings, "razorpay_key_secret", None):
+        return None
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            try:
+                import razorpay
+                import requests
+                from requests.adapters import HTTPAdapter
+                
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.razorpay_max_workers)
+                session.mount("https://", adapter)
+                _client = razorpay.Client(session=session, auth=(settings.razorpay_key_id, settings.razorpay_key_secret))
+            except Exception as e:
+                logger.warning(f"Razorpay client not available: {e}")
+                return None
+    return _client
+
+
+async def create_gateway_order(order_data: dict) -> dict:
+    """Create a Razorpay order off the event loop, guarded by timeouts and the circuit breaker"""
+    client = get_razorpay_client()
+    if client is None:
+        raise RazorpayUnavailableError("Razorpay not available")
+    if not razorpay_breaker.allow():
+        raise RazorpayUnavailableError("Razorpay circuit open")
+    
+    timeout = (settings.razorpay_connect_timeout_seconds, settings.razorpay_timeout_seconds)
+    call = partial(client.order.create, data=order_data, timeout=timeout)
+    deadline = settings.razorpay_connect_timeout_seconds + settings.razorpay_timeout_seconds
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(_executor, call), timeout=deadline)
+    except asyncio.CancelledError:
+        # Client went away: says nothing about the gateway, but a trial must not stay in flight
+        razorpay_breaker.release_trial()
+        raise
+    except Exception as e:
+        observe_dependency("razorpay", "order.create", time.perf_counter() - start, ok=False)
+        # A rejected request (4xx) says nothing about gateway health
+        if type(e).__name__ == "BadRequestError":
+            razorpay_breaker.record_success()
+        else:
+            razorpay_breaker.record_failure()
+        raise
+    observe_dependency("razorpay", "order.create", time.perf_counter() - start)
+    razorpay_breaker.record_success()
+    return result
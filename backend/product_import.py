@@ -0,0 +1,287 @@
+"""
+Bulk product import and export for admins.
+
+Import reads CSV or NDJSON straight from the request body: records are
+parsed as bytes arrive, validated one by one, and written in chunked
+upserts on `id` (a row replaces the product with that id, or creates it),
+so a catalog of thousands of SKUs takes a few dozen round trips. When a chunk
+is rejected by the database its rows are retried individually to pin the
+error on the offending rows. The report lists every rejected row by its
+1-based data row number.
+
+Export pages through the products table by id and yields each row as soon
+as its page arrives, in either format. CSV list columns (sizes, colors)
+are "|"-separated and image_variants is a JSON object, which is also what
+the CSV import accepts, so an export can be edited and re-imported.
+"""
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import codecs
+import csv
+import io
+import json
+import logging
+from config import get_settings
+from database import execute
+from images import handle_image_upload
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Column order for CSV export (and the fields an import row may carry)
+PRODUCT_COLUMNS = (
+    "id", "name", "description", "price", "image_url", "image_variants",
+    "category", "sizes", "colors", "stock_quantity",
+)
+LIST_COLUMNS = ("sizes", "colors")
+JSON_COLUMNS = ("image_variants",)
+
+
+class ImportFormatError(Exception):
+    """Raised when the body is not valid CSV/NDJSON as a whole (e.g. no header)"""
+    pass
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream as UTF-8 and yield complete lines (without the newline)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.removesuffix("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.removesuffix("\r")
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (row number, object) per non-blank line; undecodable lines yield the exception"""
+    number = 0
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"Invalid JSON: {e}")
+
+
+def _csv_value(column: str, value: str) -> Any:
+    """Convert a CSV cell to the shape CreateProductRequest expects"""
+    if value == "":
+        return [] if column in LIST_COLUMNS else None
+    if column in JSON_COLUMNS or (column in LIST_COLUMNS and value.startswith("[")):
+        return json.loads(value)
+    if column in LIST_COLUMNS:
+        return [part.strip() for part in value.split("|") if part.strip()]
+    return value
+
+
+def _ends_in_quotes(line: str, in_quotes: bool) -> bool:
+    """Whether a quoted field is still open at the end of line, following the csv
+    module's default dialect: only a '"' at the start of a field opens a quoted
+    field ('""' inside it is an escaped quote); a bare '"' elsewhere, as in
+    `12" record`, is an ordinary character."""
+    at_field_start = not in_quotes
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if in_quotes:
+            if char == '"':
+                if line[i + 1:i + 2] == '"':
+                    i += 1
+                else:
+                    in_quotes = False
+        elif char == '"' and at_field_start:
+            in_quotes = True
+            at_field_start = False
+        else:
+            at_field_start = char == ","
+        i += 1
+    return in_quotes
+
+
+async def parse_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (row number, dict) per CSV record, keyed by the header row.
+
+    Lines are gathered until no quoted field is open, so quoted fields may
+    contain newlines even across chunk boundaries; csv.reader then parses
+    the complete record."""
+    header: Optional[List[str]] = None
+    record: List[str] = []
+    in_quotes = False
+    number = 0
+    async for line in _lines(chunks):
+        record.append(line)
+        in_quotes = _ends_in_quotes(line, in_quotes)
+        if in_quotes:
+            continue
+        lines, record = record, []
+        if not "".join(lines).strip():
+            continue
+        values = next(csv.reader(f"{part}\n" for part in lines))
+        if header is None:
+            header = [name.strip() for name in values]
+            if "id" not in header:
+                raise ImportFormatError("CSV header must include an id column")
+            continue
+        number += 1
+        if len(values) != len(header):
+            yield number, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        try:
+            converted = {column: _csv_value(column, value) for column, value in zip(header, values)}
+            # Empty cells fall back to the model defaults
+            yield number, {column: value for column, value in converted.items() if value is not None}
+        except ValueError as e:
+            yield number, ValueError(f"Invalid JSON in a column: {e}")
+    if record:
+        number += 1
+        yield number, ValueError("Unterminated quoted field")
+
+
+class _Report:
+    """Import counters plus a bounded list of row errors"""
+
+    def __init__(self):
+        self.received = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def fail(self, row: int, product_id: Any, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < settings.product_import_max_errors:
+            self.errors.append({"row": row, "id": product_id, "error": error[:300]})
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def _validation_message(e: Exception) -> str:
+    errors = getattr(e, "errors", None)
+    if callable(errors):
+        return "; ".join(f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in errors())
+    return str(e)
+
+
+async def _upsert_chunk(db: "AsyncClient", chunk: List[Tuple[int, dict]], report: _Report) -> None:
+    """Upsert a chunk in one round trip; on failure retry row by row to isolate bad rows"""
+    try:
+        await execute(
+            db.table("products").upsert([row for _, row in chunk], on_conflict="id", returning="minimal")
+        )
+        report.imported += len(chunk)
+        return
+    except Exception as e:
+        if len(chunk) == 1:
+            number, row = chunk[0]
+            report.fail(number, row["id"], getattr(e, "message", None) or str(e))
+            return
+        logger.warning(f"Product import chunk of {len(chunk)} rows rejected, retrying row by row: {str(e)}")
+    for item in chunk:
+        await _upsert_chunk(db, [item], report)
+
+
+async def import_products(
+    db: "AsyncClient",
+    records: AsyncIterator[Tuple[int, Any]],
+    validate: Callable[[dict], Any],
+    chunk_size: int,
+) -> dict:
+    """Validate records with `validate` (a pydantic model's model_validate) and
+    upsert them in chunks of chunk_size. Returns the import report."""
+    report = _Report()
+    chunk: Dict[str, Tuple[int, dict]] = {}
+
+    async for number, record in records:
+        report.received += 1
+        if isinstance(record, Exception):
+            report.fail(number, None, str(record))
+            continue
+        if not isinstance(record, dict):
+            report.fail(number, None, "Row must be a JSON object")
+            continue
+        try:
+            product = validate({k: v for k, v in record.items() if k in PRODUCT_COLUMNS})
+        except Exception as e:
+            report.fail(number, record.get("id"), _validation_message(e))
+            continue
+
+        image_fields = await handle_image_upload(db, product.image_url)
+        if product.image_variants and not image_fields["image_variants"]:
+            image_fields["image_variants"] = product.image_variants
+        row = {
+            **product.model_dump(exclude={"image_url", "image_variants"}),
+            **image_fields,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+        # One upsert cannot touch the same id twice: the later row wins
+        previous = chunk.pop(product.id, None)
+        if previous is not None:
+            report.fail(previous[0], product.id, f"Duplicate id, superseded by row {number}")
+        chunk[product.id] = (number, row)
+
+        if len(chunk) >= chunk_size:
+            await _upsert_chunk(db, list(chunk.values()), report)
+            chunk = {}
+
+    if chunk:
+        await _upsert_chunk(db, list(chunk.values()), report)
+    logger.info(f"Product import: {report.imported} imported, {report.failed} failed of {report.received} rows")
+    return report.as_dict()
+
+
+async def iter_products(db: "AsyncClient", page_size: int) -> AsyncIterator[dict]:
+    """Yield every product in id order, one keyset page per round trip"""
+    after: Optional[str] = None
+    while True:
+        query = db.table("products").select(",".join(PRODUCT_COLUMNS)).order("id").limit(page_size)
+        if after is not None:
+            query = query.gt("id", after)
+        response = await execute(query)
+        rows = response.data or []
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        after = rows[-1]["id"]
+
+
+def _csv_line(values: List[Any]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values)
+    return buffer.getvalue()
+
+
+def _csv_cell(column: str, value: Any) -> Any:
+    if value is None:
+        return ""
+    if column in LIST_COLUMNS:
+        return "|".join(str(item) for item in value)
+    if column in JSON_COLUMNS:
+        return json.dumps(value, separators=(",", ":"))
+    return value
+
+
+async def export_products(db: "AsyncClient", fmt: str, page_size: int) -> AsyncIterator[str]:
+    """Stream the catalog as CSV (with a header row) or NDJSON"""
+    if fmt == "csv":
+        yield _csv_line(list(PRODUCT_COLUMNS))
+    async for row in iter_products(db, page_size):
+        if fmt == "csv":
+            yield _csv_line([_csv_cell(column, row.get(column)) for column in PRODUCT_COLUMNS])
+        else:
+            yield json.dumps(row, separators=(",", ":")) + "\n"
@@ -0,0 +1,120 @@
+"""
+Per-request accounting of Supabase round trips.
+
+QueryStatsMiddleware opens a fresh QueryStats for every HTTP request (held in
+a context variable, so concurrent requests never mix). database.execute()
+records each call and the pooled HTTP client's response hook adds the bytes
+sent and received. When the request ends:
+
+- calls slower than DB_SLOW_QUERY_MS are logged as they happen,
+- a request that hits the same table DB_REPEATED_QUERY_THRESHOLD or more
+  times is logged as a likely N+1 / chatty code path (tables whose access
+  pattern needs several calls by design are exempt),
+- with DB_DEBUG_HEADERS on, X-DB-Round-Trips, X-DB-Bytes and X-DB-Time-Ms
+  are added to the response.
+"""
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import logging
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# The table-backed idempotency store reads, claims and completes a key: three calls by design
+EXEMPT_TABLES = {"idempotency_keys"}
+
+
+class QueryStats:
+    """Supabase calls made while serving one request"""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.seconds = 0.0
+        self.calls: List[Tuple[str, float]] = []
+
+    def tables(self) -> Dict[str, int]:
+        """Calls per table (or RPC / storage), ignoring the HTTP method"""
+        counts: Dict[str, int] = {}
+        for operation, _ in self.calls:
+            resource = operation.split(" ", 1)[-1]
+            counts[resource] = counts.get(resource, 0) + 1
+        return counts
+
+    def repeated_tables(self, threshold: int) -> Dict[str, int]:
+        return {
+            table: count for table, count in self.tables().items()
+            if count >= threshold and table not in EXEMPT_TABLES
+        }
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def record_query(operation: str, seconds: float) -> None:
+    """Called by database.execute() for every round trip"""
+    if seconds * 1000 >= settings.db_slow_query_ms:
+        logger.warning(f"Slow Supabase call: {operation} took {seconds * 1000:.0f} ms")
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.round_trips += 1
+    stats.seconds += seconds
+    stats.calls.append((operation, seconds))
+
+
+async def record_response_bytes(response) -> None:
+    """httpx response hook: count request and response body sizes"""
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.bytes_sent += int(response.request.headers.get("content-length") or 0)
+    content_length = response.headers.get("content-length")
+    if content_length is None:
+        # Chunked body: PostgREST parses it right after this hook anyway
+        await response.aread()
+        content_length = len(response.content)
+    stats.bytes_received += int(content_length)
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware collecting QueryStats for each HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start" and settings.db_debug_headers:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-round-trips", str(stats.round_trips).encode()),
+                    (b"x-db-bytes", str(stats.bytes_sent + stats.bytes_received).encode()),
+                    (b"x-db-time-ms", f"{stats.seconds * 1000:.1f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            repeated = stats.repeated_tables(settings.db_repeated_query_threshold)
+            if repeated:
+                route = getattr(scope.get("route"), "path", None) or scope["path"]
+                summary = ", ".join(f"{table} x{count}" for table, count in sorted(repeated.items()))
+                logger.warning(
+                    f"Repeated Supabase queries in {scope['method']} {route}: {summary} "
+                    f"({stats.round_trips} round trips, {stats.seconds * 1000:.0f} ms)"
+                )
@@ -1,20 +1,37 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Header, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from pathlib import Path
-from pydantic import BaseModel
-from typing import List, Optional, Annotated
+from pydantic import BaseModel, TypeAdapter, create_model
+from typing import TYPE_CHECKING, Dict, List, Literal, Optional, Annotated, Tuple
 import os
+import asyncio
 import logging
 import hmac
 import hashlib
-import base64
-import uuid
 from datetime import datetime
-from supabase import create_client, Client
+from functools import lru_cache
 from config import get_settings
 from auth_middleware import verify_jwt
 from admin_middleware import get_admin_info
+from database import get_db, execute, check_connection, close_supabase
+import database
+from catalog_cache import catalog_cache, order_cache, make_etag, etag_matches
+from pagination import apply_keyset, paginate
+from images import handle_image_upload, receive_image_upload, store_uploaded_image, ImageTooLargeError, UnsupportedImageError
+from image_migration import migrate_inline_images
+from product_import import ImportFormatError, parse_csv, parse_ndjson, import_products, export_products
+from inventory import release_order_stock, release_expired_reservations, run_reservation_sweeper, settle_late_payment
+from payments import get_razorpay_client, create_gateway_order
+from idempotency import run_idempotent
+from webhook_queue import webhook_queue, event_id_for, enqueue_event, drain_queue, run_webhook_worker
+from metrics import metrics, MetricsMiddleware
+from query_stats import QueryStatsMiddleware
+from health import readiness
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -23,82 +40,13 @@ load_dotenv(ROOT_DIR / '.env')
 # Get settings
 settings = get_settings()
 
-# Configure logging (must be before Supabase initialization to use logger)
+# Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Supabase client (with graceful failure handling)
-supabase: Optional[Client] = None
-supabase_error: Optional[str] = None
-
-try:
-    # Validate Supabase URL
-    supabase_url = settings.supabase_url.strip() if settings.supabase_url else ""
-    
-    if not supabase_url:
-        is_vercel = os.getenv("VERCEL") == "1" or os.getenv("VERCEL_ENV")
-        if is_vercel:
-            error_msg = "SUPABASE_URL is not set. Add it in Vercel project settings → Environment Variables."
-        else:
-            error_msg = "SUPABASE_URL is not set in environment variables. Please add it to backend/.env file"
-        logger.error(f"CONFIGURATION ERROR: {error_msg}")
-        supabase_error = error_msg
-    elif not settings.supabase_service_role_key:
-        is_vercel = os.getenv("VERCEL") == "1" or os.getenv("VERCEL_ENV")
-        if is_vercel:
-            error_msg = "SUPABASE_SERVICE_ROLE_KEY is not set. Add it in Vercel project settings → Environment Variables."
-        else:
-            error_msg = "SUPABASE_SERVICE_ROLE_KEY is not set in environment variables"
-        logger.error(f"CONFIGURATION ERROR: {error_msg}")
-        supabase_error = error_msg
-    else:
-        # Ensure URL has proper format
-        if not supabase_url.startswith("http://") and not supabase_url.startswith("https://"):
-            logger.warning("Supabase URL missing protocol, adding https://")
-            supabase_url = f"https://{supabase_url}"
-        
-        # Validate URL format
-        if ".supabase.co" not in supabase_url:
-            logger.warning(f"Supabase URL might be incorrect: {supabase_url}")
-        
-        logger.info(f"Connecting to Supabase: {supabase_url}")
-        supabase = create_client(supabase_url, settings.supabase_service_role_key)
-        
-        # Test connection with a simple query (non-blocking)
-        try:
-            test_response = supabase.table("products").select("id").limit(1).execute()
-            logger.info("✓ Supabase connection verified successfully")
-        except Exception as test_error:
-            error_str = str(test_error)
-            if "Invalid API key" in error_str or "401" in error_str or "unauthorized" in error_str.lower():
-                is_vercel = os.getenv("VERCEL") == "1" or os.getenv("VERCEL_ENV")
-                logger.error("✗ Invalid Supabase API key detected!")
-                supabase_error = "Invalid Supabase API key. Check SUPABASE_SERVICE_ROLE_KEY in Vercel environment variables."
-            else:
-                logger.warning(f"⚠ Supabase connection test failed: {error_str}")
-                logger.warning("The client is initialized but connection will be tested on first query")
-                
-except Exception as e:
-    error_msg = str(e)
-    logger.error(f"SUPABASE INITIALIZATION ERROR: {error_msg}")
-    supabase_error = f"Failed to initialize Supabase: {error_msg}"
-    # Don't raise - allow the app to start so we can return JSON errors
-
-# Razorpay: lazy import to avoid pkg_resources issues on some hosts (e.g. Render)
-def _get_razorpay_client():
-    """Return Razorpay client or None if unavailable. Import is done here to allow app to start."""
-    if not getattr(settings, "razorpay_key_id", None) or not getattr(settings, "razorpay_key_secret", None):
-        return None
-    try:
-        import razorpay
-        return razorpay.Client(auth=(settings.razorpay_key_id, settings.razorpay_key_secret))
-    except Exception as e:
-        logger.warning(f"Razorpay client not available: {e}")
-        return None
-
 # Create the main app
 app = FastAPI(title="TrippyDrip API")
 
@@ -113,12 +61,35 @@ class Product(BaseModel):
     description: Optional[str] = None
     price: float
     image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, str]] = None  # width -> WebP URL, for srcset
     category: str
     sizes: List[str]
     colors: List[str]
     stock_quantity: int
 
 
+class ProductCard(BaseModel):
+    """Compact listing shape: only what the shop grid renders"""
+    id: str
+    name: str
+    price: float
+    image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, str]] = None
+    category: str
+    stock_quantity: int
+
+
+class ProductListParams(BaseModel):
+    limit: int
+    cursor: Optional[str] = None
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: Optional[bool] = None
+    sort: str = "newest"
+    fields: Optional[Tuple[str, ...]] = None  # None = endpoint default shape
+
+
 class OrderItem(BaseModel):
     product_id: str
     quantity: int
@@ -160,6 +131,7 @@ class CreateProductRequest(BaseModel):
     description: Optional[str] = None
     price: float
     image_url: Optional[str] = None  # Can be URL or base64 data URL
+    image_variants: Optional[Dict[str, str]] = None  # From POST /api/admin/images
     category: str
     sizes: List[str]
     colors: List[str]
@@ -171,70 +143,197 @@ class UpdateProductRequest(BaseModel):
     description: Optional[str] = None
     price: Optional[float] = None
     image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, str]] = None
     category: Optional[str] = None
     sizes: Optional[List[str]] = None
     colors: Optional[List[str]] = None
     stock_quantity: Optional[int] = None
 
 
+class ProductChanges(BaseModel):
+    price: Optional[float] = None
+    stock_quantity: Optional[int] = None  # New absolute stock level
+    stock_delta: Optional[int] = None  # Or a relative change, e.g. +50 for a restock
+
+
+class ProductBatchUpdate(BaseModel):
+    id: str
+    changes: ProductChanges
+
+
+class BatchUpdateProductsRequest(BaseModel):
+    updates: List[ProductBatchUpdate]
+
+
+product_adapter = TypeAdapter(Product)
+product_card_list_adapter = TypeAdapter(List[ProductCard])
+
+
+@lru_cache(maxsize=64)
+def product_projection_adapter(fields: Tuple[str, ...]) -> TypeAdapter:
+    """List serializer for an arbitrary subset of Product fields"""
+    projection = create_model(
+        "ProductProjection",
+        **{name: (Product.model_fields[name].annotation, Product.model_fields[name]) for name in fields}
+    )
+    return TypeAdapter(List[projection])
+
+# Product listing sort orders: name -> (column, descending). Ties break on id.
+PRODUCT_SORTS = {
+    "newest": ("created_at", True),
+    "oldest": ("created_at", False),
+    "price_asc": ("price", False),
+    "price_desc": ("price", True),
+    "name": ("name", False),
+}
+
+
+async def product_list_params(
+    limit: int = Query(settings.products_page_size, ge=1, le=settings.products_max_page_size),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: Optional[bool] = None,
+    sort: Literal["newest", "oldest", "price_asc", "price_desc", "name"] = "newest",
+    fields: Optional[str] = Query(None, description="Comma-separated product fields to return"),
+) -> ProductListParams:
+    """Dependency collecting pagination, filter, sort and projection query parameters"""
+    selected = None
+    if fields:
+        selected = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in selected if name not in Product.model_fields]
+        if unknown or not selected:
+            raise HTTPException(status_code=400, detail=f"Unknown product fields: {', '.join(unknown) or fields}")
+    return ProductListParams(
+        limit=limit,
+        cursor=cursor,
+        category=category,
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=in_stock,
+        sort=sort,
+        fields=selected,
+    )
+
+
+def product_list_columns(fields: Optional[Tuple[str, ...]], sort: str) -> str:
+    """Select list for a projection; id and the sort column are always needed for the cursor"""
+    if fields is None:
+        return "*"
+    return ",".join(dict.fromkeys(("id", PRODUCT_SORTS[sort][0]) + fields))
+
+
+def build_product_list_query(db: "AsyncClient", params: ProductListParams, fields: Optional[Tuple[str, ...]] = None):
+    """Push projection, filters, keyset position and sort order down into a products query"""
+    query = db.table("products").select(product_list_columns(fields, params.sort))
+    if params.category:
+        query = query.eq("category", params.category)
+    if params.min_price is not None:
+        query = query.gte("price", params.min_price)
+    if params.max_price is not None:
+        query = query.lte("price", params.max_price)
+    if params.in_stock is True:
+        query = query.gt("stock_quantity", 0)
+    elif params.in_stock is False:
+        query = query.lte("stock_quantity", 0)
+    
+    column, desc = PRODUCT_SORTS[params.sort]
+    query = apply_keyset(query, column, desc, params.cursor)
+    # Fetch one extra row to know whether another page exists
+    return query.limit(params.limit + 1)
+
+
+def catalog_entry(body: bytes) -> dict:
+    """Cacheable catalog response: serialized body plus its ETag"""
+    return {"body": body, "etag": make_etag(body)}
+
+
+def catalog_response(request: Request, entry: dict) -> Response:
+    """Return 304 when the client already holds this version, else the cached body"""
+    headers = {"ETag": entry["etag"], "Cache-Control": settings.catalog_cache_control}
+    if entry.get("next_cursor"):
+        headers["X-Next-Cursor"] = entry["next_cursor"]
+    if etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
 # Root endpoint
 @api_router.get("/")
 async def root():
     return {"message": "TrippyDrip API is running", "version": "1.0.0"}
 
-# Health check endpoint with Supabase connection test
+# Liveness: the process is up and serving. No I/O, so it is safe to poll often.
+@api_router.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+
+# Readiness: cached result of the background Supabase probe (see health.py)
+@api_router.get("/health/ready")
+async def readiness_check(response: Response):
+    """Ready when the last probe reached Supabase; 503 otherwise"""
+    probe = await readiness.current()
+    if not probe.ready:
+        response.status_code = 503
+    return probe.snapshot()
+
+
+# Health check endpoint with Supabase connection status (served from the readiness cache)
 @api_router.get("/health")
 async def health_check():
-    """Health check endpoint to verify Supabase connection"""
+    """Health check endpoint reporting the last Supabase connection probe"""
     is_vercel = os.getenv("VERCEL") == "1" or os.getenv("VERCEL_ENV")
+    probe = await readiness.current()
+    checked = {"checked_at": probe.checked_at, "age_seconds": probe.snapshot()["age_seconds"]}
     
-    if supabase is None:
-        return {
-            "status": "unhealthy",
-            "supabase": "not_initialized",
-            "error": supabase_error or "Supabase client not initialized",
-            "environment": "vercel" if is_vercel else "local",
-            "hint": "Check SUPABASE_SERVICE_ROLE_KEY in Vercel environment variables" if is_vercel else "Check SUPABASE_SERVICE_ROLE_KEY in backend/.env"
-        }
-    
-    try:
-        # Test Supabase connection
-        test_response = supabase.table("products").select("id").limit(1).execute()
+    if probe.supabase == "connected":
         return {
             "status": "healthy",
             "supabase": "connected",
             "products_table": "accessible",
-            "environment": "vercel" if is_vercel else "local"
-        }
-    except Exception as e:
-        error_msg = str(e)
-        return {
-            "status": "unhealthy",
-            "supabase": "disconnected",
-            "error": error_msg[:200],  # Limit error message length
             "environment": "vercel" if is_vercel else "local",
-            "hint": "Check SUPABASE_SERVICE_ROLE_KEY in Vercel environment variables" if is_vercel else "Check SUPABASE_SERVICE_ROLE_KEY in backend/.env"
+            **checked
         }
+    return {
+        "status": "unhealthy",
+        "supabase": probe.supabase,
+        "error": probe.error,
+        "environment": "vercel" if is_vercel else "local",
+        "hint": "Check SUPABASE_SERVICE_ROLE_KEY in Vercel environment variables" if is_vercel else "Check SUPABASE_SERVICE_ROLE_KEY in backend/.env",
+        **checked
+    }
 
 
 # Product Endpoints
-@api_router.get("/products", response_model=List[Product])
-async def get_products():
-    """Get all products"""
-    # Check if Supabase is initialized
-    if supabase is None:
-        is_vercel = os.getenv("VERCEL") == "1" or os.getenv("VERCEL_ENV")
-        error_detail = supabase_error or "Supabase client not initialized"
-        if is_vercel:
-            detail_msg = f"Database not configured. {error_detail}. Please check your SUPABASE_SERVICE_ROLE_KEY in Vercel environment variables."
-        else:
-            detail_msg = f"Database not configured. {error_detail}. Please check your backend/.env file."
-        raise HTTPException(status_code=500, detail=detail_msg)
+@api_router.get("/products", response_model=List[ProductCard])
+async def get_products(
+    request: Request,
+    params: ProductListParams = Depends(product_list_params),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Get one page of products in the compact card shape, or only the columns named
+    in `fields`. Full detail is served by GET /products/{product_id}.
+    The cursor for the next page is sent in X-Next-Cursor."""
+    cache_key = f"products:{params.model_dump_json()}"
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return catalog_response(request, cached)
     
     try:
-        response = supabase.table("products").select("*").execute()
-        logger.info(f"Public products endpoint: fetched {len(response.data) if response.data else 0} products")
-        return response.data
+        version = catalog_cache.version
+        fields = params.fields or tuple(ProductCard.model_fields)
+        response = await execute(build_product_list_query(db, params, fields))
+        rows, next_cursor = paginate(response.data or [], params.limit, PRODUCT_SORTS[params.sort][0])
+        logger.info(f"Public products endpoint: fetched {len(rows)} products")
+        adapter = product_card_list_adapter if params.fields is None else product_projection_adapter(fields)
+        entry = catalog_entry(adapter.dump_json(adapter.validate_python(rows)))
+        entry["next_cursor"] = next_cursor
+        catalog_cache.set(cache_key, entry, version)
+        return catalog_response(request, entry)
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Error fetching products: {error_msg}")
@@ -275,15 +374,24 @@ async def get_products():
 
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request, db: "AsyncClient" = Depends(get_db)):
     """Get single product by ID"""
+    cache_key = f"product:{product_id}"
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return catalog_response(request, cached)
+    
     try:
-        response = supabase.table("products").select("*").eq("id", product_id).execute()
+        version = catalog_cache.version
+        response = await execute(db.table("products").select("*").eq("id", product_id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        return response.data[0]
+        product = product_adapter.validate_python(response.data[0])
+        entry = catalog_entry(product_adapter.dump_json(product))
+        catalog_cache.set(cache_key, entry, version)
+        return catalog_response(request, entry)
     except HTTPException:
         raise
     except Exception as e:
@@ -292,91 +400,52 @@ async def get_product(product_id: str):
 
 
 # Admin Product Management Endpoints
-async def upload_image_to_supabase(image_data: bytes, filename: str, folder: str = "products") -> Optional[str]:
-    """Upload image to Supabase Storage and return public URL. Returns None if upload fails."""
+@api_router.post("/admin/images")
+async def upload_product_image(
+    request: Request,
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Upload a product image as multipart/form-data in a `file` field (Admin only).
+    Returns image_url and image_variants to send in the product payload.
+    The form is parsed here, not by FastAPI, so oversized bodies are refused
+    before they are spooled to disk."""
+    file = None
     try:
-        # Generate unique filename
-        file_ext = filename.split('.')[-1] if '.' in filename else 'jpg'
-        unique_filename = f"{uuid.uuid4()}.{file_ext}"
-        file_path = f"{folder}/{unique_filename}"
-        
-        # Upload to Supabase Storage
-        try:
-            storage_response = supabase.storage.from_("product-images").upload(
-                file_path,
-                image_data,
-                file_options={"content-type": f"image/{file_ext}", "upsert": "true"}
-            )
-        except Exception as storage_error:
-            logger.warning(f"Supabase storage upload failed: {str(storage_error)}. Using base64 data URL instead.")
-            # If storage fails, return None to use base64 data URL
-            return None
-        
-        # Get public URL - construct it manually since Supabase storage URL format is predictable
-        # Format: https://<project_ref>.supabase.co/storage/v1/object/public/<bucket>/<path>
-        project_ref = settings.supabase_url.split("//")[1].split(".")[0] if "//" in settings.supabase_url else "iojrjuicfhqemwvlvdev"
-        public_url = f"https://{project_ref}.supabase.co/storage/v1/object/public/product-images/{file_path}"
-        
-        return public_url
-        
+        file = await receive_image_upload(request)
+        if file is None:
+            raise HTTPException(status_code=422, detail="Multipart field 'file' is required")
+        uploaded = await store_uploaded_image(db, file)
+        logger.info(f"Admin {admin_info['admin_id']} uploaded image {uploaded['image_url']} ({uploaded['bytes']} bytes)")
+        return {"success": True, **uploaded}
+    except HTTPException:
+        raise
+    except UnsupportedImageError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        logger.error(f"Error uploading image to Supabase: {str(e)}")
-        # Return None instead of raising error - will use base64 data URL as fallback
-        return None
-
-
-async def handle_image_upload(image_data: Optional[str] = None) -> Optional[str]:
-    """Handle image upload from base64 data URL or return existing URL"""
-    if not image_data:
-        return None
-    
-    # If it's already a URL, return it
-    if image_data.startswith("http://") or image_data.startswith("https://"):
-        return image_data
-    
-    # If it's a base64 data URL, try to upload to storage, fallback to data URL
-    if image_data.startswith("data:image/"):
-        try:
-            # Parse data URL: data:image/png;base64,<data>
-            header, encoded = image_data.split(",", 1)
-            image_bytes = base64.b64decode(encoded)
-            
-            # Extract file extension from header
-            mime_type = header.split(";")[0].split(":")[1].split("/")[1]
-            filename = f"product.{mime_type}"
-            
-            # Try to upload to Supabase Storage
-            uploaded_url = await upload_image_to_supabase(image_bytes, filename)
-            
-            # If upload succeeded, return the storage URL
-            if uploaded_url:
-                return uploaded_url
-            
-            # If upload failed, return the original base64 data URL as fallback
-            logger.info("Using base64 data URL as fallback (storage upload failed)")
-            return image_data
-            
-        except Exception as e:
-            logger.error(f"Error processing base64 image: {str(e)}")
-            # Return the original data URL as fallback instead of raising error
-            return image_data
-    
-    # If format is unknown, return as-is (might be a valid URL without http/https)
-    logger.warning(f"Unknown image format, using as-is: {image_data[:50]}...")
-    return image_data
+        logger.error(f"Error uploading image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
+    finally:
+        if file is not None:
+            await file.close()
 
 
 @api_router.post("/admin/products")
 async def create_product(
     product_data: CreateProductRequest,
-    admin_info: dict = Depends(get_admin_info)
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
 ):
     """Create a new product (Admin only)"""
+    from postgrest.exceptions import APIError  # Loaded with the Supabase client, not at import
+    
     try:
         # Handle image upload if provided
-        image_url = product_data.image_url
-        if image_url:
-            image_url = await handle_image_upload(image_url)
+        image_fields = await handle_image_upload(db, product_data.image_url)
+        if product_data.image_variants and not image_fields["image_variants"]:
+            image_fields["image_variants"] = product_data.image_variants
         
         # Prepare product data
         product_dict = {
@@ -384,7 +453,7 @@ async def create_product(
             "name": product_data.name,
             "description": product_data.description,
             "price": product_data.price,
-            "image_url": image_url,
+            **image_fields,
             "category": product_data.category,
             "sizes": product_data.sizes,
             "colors": product_data.colors,
@@ -393,9 +462,14 @@ async def create_product(
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        # Insert into database
+        # Insert into database; the response carries the stored row, so no re-select is needed
         logger.info(f"Inserting product: {product_dict}")
-        response = supabase.table("products").insert(product_dict).execute()
+        try:
+            response = await execute(db.table("products").insert(product_dict))
+        except APIError as e:
+            if e.code != "23505":  # unique_violation on the primary key
+                raise
+            raise HTTPException(status_code=409, detail=f"Product {product_data.id} already exists")
         
         logger.info(f"Insert response: {response}")
         logger.info(f"Response data: {response.data if hasattr(response, 'data') else 'No data attribute'}")
@@ -405,16 +479,10 @@ async def create_product(
             raise HTTPException(status_code=500, detail="Failed to create product: No data returned")
         
         created_product = response.data[0]
+        catalog_cache.invalidate()
         logger.info(f"Admin {admin_info['admin_id']} created product {product_data.id}: {created_product.get('name', 'Unknown')}")
         logger.info(f"Created product details: ID={created_product.get('id')}, Name={created_product.get('name')}")
         
-        # Immediately verify the product exists
-        verify_response = supabase.table("products").select("*").eq("id", product_data.id).execute()
-        if verify_response.data:
-            logger.info(f"Product verified in database: {verify_response.data[0].get('name')}")
-        else:
-            logger.warning(f"Product {product_data.id} not found immediately after creation!")
-        
         return {"success": True, "product": created_product}
         
     except HTTPException:
@@ -428,15 +496,11 @@ async def create_product(
 async def update_product(
     product_id: str,
     product_data: UpdateProductRequest,
-    admin_info: dict = Depends(get_admin_info)
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
 ):
     """Update an existing product (Admin only)"""
     try:
-        # Check if product exists
-        existing = supabase.table("products").select("*").eq("id", product_id).execute()
-        if not existing.data:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
         # Prepare update data
         update_data = {}
         if product_data.name is not None:
@@ -456,19 +520,22 @@ async def update_product(
         
         # Handle image upload if provided
         if product_data.image_url is not None:
-            update_data["image_url"] = await handle_image_upload(product_data.image_url)
+            update_data.update(await handle_image_upload(db, product_data.image_url))
+            if product_data.image_variants and not update_data["image_variants"]:
+                update_data["image_variants"] = product_data.image_variants
         
         if not update_data:
             raise HTTPException(status_code=400, detail="No data to update")
         
         update_data["updated_at"] = datetime.utcnow().isoformat()
         
-        # Update product
-        response = supabase.table("products").update(update_data).eq("id", product_id).execute()
+        # Update product; the returned representation is empty when no product has this id
+        response = await execute(db.table("products").update(update_data).eq("id", product_id))
         
         if not response.data:
-            raise HTTPException(status_code=500, detail="Failed to update product")
+            raise HTTPException(status_code=404, detail="Product not found")
         
+        catalog_cache.invalidate()
         logger.info(f"Admin {admin_info['admin_id']} updated product {product_id}")
         return {"success": True, "product": response.data[0]}
         
@@ -482,24 +549,29 @@ async def update_product(
 @api_router.delete("/admin/products/{product_id}")
 async def delete_product(
     product_id: str,
-    admin_info: dict = Depends(get_admin_info)
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
 ):
-    """Delete a product (Admin only)"""
+    """Delete a product (Admin only). Products that appear in orders cannot be deleted."""
+    from postgrest.exceptions import APIError  # Loaded with the Supabase client, not at import
+    
     try:
-        # Check if product exists
-        existing = supabase.table("products").select("*").eq("id", product_id).execute()
-        if not existing.data:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
-        # Delete related order_items first (foreign key constraint)
+        # One round trip: the exact row count tells whether the product existed
         try:
-            supabase.table("order_items").delete().eq("product_id", product_id).execute()
-        except Exception:
-            pass  # No order_items to delete, that's fine
-
-        # Delete product
-        response = supabase.table("products").delete().eq("id", product_id).execute()
+            response = await execute(
+                db.table("products").delete(count="exact", returning="minimal").eq("id", product_id)
+            )
+        except APIError as e:
+            if e.code != "23503":  # foreign_key_violation: order_items still reference it
+                raise
+            raise HTTPException(
+                status_code=409,
+                detail="Product is part of existing orders; set its stock to 0 instead of deleting it",
+            )
+        if not response.count:
+            raise HTTPException(status_code=404, detail="Product not found")
         
+        catalog_cache.invalidate()
         logger.info(f"Admin {admin_info['admin_id']} deleted product {product_id}")
         return {"success": True, "message": "Product deleted successfully"}
         
@@ -510,43 +582,178 @@ async def delete_product(
         raise HTTPException(status_code=500, detail=f"Failed to delete product: {str(e)}")
 
 
+@api_router.patch("/admin/products")
+async def batch_update_products(
+    request_data: BatchUpdateProductsRequest,
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Apply price and stock changes to many products in one round trip (Admin only).
+    Returns the ids that were updated and the ids that do not exist."""
+    updates = request_data.updates
+    if not updates:
+        raise HTTPException(status_code=400, detail="No updates provided")
+    if len(updates) > settings.product_batch_max_updates:
+        raise HTTPException(status_code=400, detail=f"At most {settings.product_batch_max_updates} updates per request")
+    
+    ids = [update.id for update in updates]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Each product id may appear only once per request")
+    for update in updates:
+        changes = update.changes
+        if changes.price is None and changes.stock_quantity is None and changes.stock_delta is None:
+            raise HTTPException(status_code=400, detail=f"No changes for product {update.id}")
+        if changes.stock_quantity is not None and changes.stock_delta is not None:
+            raise HTTPException(status_code=400, detail=f"Use either stock_quantity or stock_delta for product {update.id}")
+        if (changes.price is not None and changes.price < 0) or (changes.stock_quantity is not None and changes.stock_quantity < 0):
+            raise HTTPException(status_code=400, detail=f"Price and stock must not be negative (product {update.id})")
+    
+    try:
+        payload = [{"id": update.id, **update.changes.model_dump(exclude_none=True)} for update in updates]
+        response = await execute(db.rpc("batch_update_products", {"p_updates": payload}))
+        updated = response.data or []
+    except Exception as e:
+        logger.error(f"Error batch updating products: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to update products: {str(e)}")
+    
+    if updated:
+        catalog_cache.invalidate()
+    found = set(updated)
+    missing = [product_id for product_id in ids if product_id not in found]
+    logger.info(f"Admin {admin_info['admin_id']} batch updated {len(updated)} products ({len(missing)} missing)")
+    return {"success": True, "updated": updated, "missing": missing}
+
+
 @api_router.get("/admin/products")
-async def list_all_products(admin_info: dict = Depends(get_admin_info)):
-    """Get all products with admin details (Admin only)"""
+async def list_all_products(
+    admin_info: dict = Depends(get_admin_info),
+    params: ProductListParams = Depends(product_list_params),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Get one page of products with admin details (Admin only). Newest first by default."""
     try:
-        # Get all products - use simple query first
         logger.info(f"Admin {admin_info['admin_id']} requesting products list")
-        response = supabase.table("products").select("*").execute()
+        response = await execute(build_product_list_query(db, params, params.fields))
+        products, next_cursor = paginate(response.data or [], params.limit, PRODUCT_SORTS[params.sort][0])
+        if params.fields:
+            products = [{name: product.get(name) for name in params.fields} for product in products]
         
-        logger.info(f"Raw Supabase response: {len(response.data) if response.data else 0} products found")
+        logger.info(f"Admin {admin_info['admin_id']} fetched {len(products)} products")
+        logger.debug(f"Product IDs: {[p.get('id') for p in products[:5]]}")
         
-        if not response.data:
-            logger.info(f"Admin {admin_info['admin_id']} fetched 0 products")
-            return {"success": True, "products": [], "count": 0}
-        
-        # Sort by created_at descending (newest first) in Python
-        sorted_products = sorted(
-            response.data, 
-            key=lambda x: x.get("created_at", "") or "", 
-            reverse=True
-        )
-        
-        logger.info(f"Admin {admin_info['admin_id']} fetched {len(sorted_products)} products")
-        logger.debug(f"Product IDs: {[p.get('id') for p in sorted_products[:5]]}")
-        
-        return {"success": True, "products": sorted_products, "count": len(sorted_products)}
+        return {"success": True, "products": products, "count": len(products), "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching products: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to fetch products: {str(e)}")
 
 
+@api_router.post("/admin/products/import")
+async def import_product_catalog(
+    request: Request,
+    fmt: Optional[Literal["csv", "ndjson"]] = Query(
+        None, alias="format", description="Body format; defaults to csv for text/csv, else ndjson"
+    ),
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Create or update products from a streamed CSV or NDJSON body (Admin only).
+    Each row is validated like POST /admin/products and replaces the product with
+    the same id; rows are written in batches. Returns a per-row error report."""
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    parse = parse_csv if fmt == "csv" else parse_ndjson
+    try:
+        report = await import_products(
+            db, parse(request.stream()), CreateProductRequest.model_validate, settings.product_import_chunk_size
+        )
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        catalog_cache.invalidate()  # Earlier batches may have been written
+        logger.error(f"Error importing products: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to import products: {str(e)}")
+    
+    if report["imported"]:
+        catalog_cache.invalidate()
+    logger.info(f"Admin {admin_info['admin_id']} imported {report['imported']} products ({report['failed']} rows failed)")
+    return {"success": True, **report}
+
+
+@api_router.get("/admin/products/export")
+async def export_product_catalog(
+    fmt: Literal["csv", "ndjson"] = Query("ndjson", alias="format"),
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Stream every product as CSV or NDJSON, in the format the import accepts (Admin only)"""
+    logger.info(f"Admin {admin_info['admin_id']} exporting products as {fmt}")
+    filename = f"products-{datetime.utcnow():%Y%m%d}.{fmt}"
+    return StreamingResponse(
+        export_products(db, fmt, settings.product_export_page_size),
+        media_type="text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@api_router.post("/admin/images/migrate")
+async def migrate_product_images(
+    batch_size: int = Query(20, ge=1, le=100),
+    max_batches: int = Query(5, ge=1, le=50),
+    after: Optional[str] = None,
+    dry_run: bool = False,
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Move inline base64 product images into storage (Admin only).
+    Call again with `after=<next_after>` until next_after is null."""
+    try:
+        report = await migrate_inline_images(db, batch_size=batch_size, max_batches=max_batches, after=after, dry_run=dry_run)
+        if report["migrated"] and not dry_run:
+            catalog_cache.invalidate()
+        logger.info(f"Admin {admin_info['admin_id']} migrated {report['migrated']} inline images ({report['bytes_reclaimed']} bytes reclaimed)")
+        return {"success": True, **report}
+    except Exception as e:
+        logger.error(f"Error migrating product images: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to migrate images: {str(e)}")
+
+
+@api_router.post("/admin/inventory/release-expired")
+async def release_expired_stock(
+    limit: int = Query(100, ge=1, le=1000),
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Return stock held by unpaid orders whose reservation expired (Admin only)"""
+    try:
+        released = await release_expired_reservations(db, limit)
+        if released:
+            catalog_cache.invalidate()
+        logger.info(f"Admin {admin_info['admin_id']} released stock for {released} expired orders")
+        return {"success": True, "released_orders": released}
+    except Exception as e:
+        logger.error(f"Error releasing expired reservations: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to release reservations: {str(e)}")
+
+
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(admin_info: dict = Depends(get_admin_info)):
+    """Get catalog and order cache hit/miss counters (Admin only)"""
+    return {"success": True, "catalog": catalog_cache.stats(), "orders": order_cache.stats()}
+
+
+@api_router.get("/admin/metrics")
+async def get_metrics(admin_info: dict = Depends(get_admin_info)):
+    """Per-route request counts and latency, plus Supabase/Razorpay call latency,
+    in Prometheus text format (Admin only). Numbers are for this worker."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Contact Endpoint
 @api_router.post("/contact")
-async def submit_contact(contact: ContactMessageRequest):
+async def submit_contact(contact: ContactMessageRequest, db: "AsyncClient" = Depends(get_db)):
     """Receive a contact form submission and store it in Supabase"""
-    if supabase is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-
     try:
         row = {
             "name": contact.name,
@@ -555,7 +762,7 @@ async def submit_contact(contact: ContactMessageRequest):
             "message": contact.message,
             "created_at": datetime.utcnow().isoformat(),
         }
-        response = supabase.table("contact_messages").insert(row).execute()
+        response = await execute(db.table("contact_messages").insert(row))
 
         if not response.data:
             # Table might not exist yet — log but still confirm to user
@@ -580,10 +787,10 @@ async def submit_contact(contact: ContactMessageRequest):
 
 # Admin Contact Messages Endpoint
 @api_router.get("/admin/messages")
-async def get_contact_messages(admin_info: dict = Depends(get_admin_info)):
+async def get_contact_messages(admin_info: dict = Depends(get_admin_info), db: "AsyncClient" = Depends(get_db)):
     """Get all contact messages (Admin only)"""
     try:
-        response = supabase.table("contact_messages").select("*").order("created_at", desc=True).execute()
+        response = await execute(db.table("contact_messages").select("*").order("created_at", desc=True))
         messages = response.data if response.data else []
         logger.info(f"Admin {admin_info['admin_id']} fetched {len(messages)} contact messages")
         return {"success": True, "messages": messages, "count": len(messages)}
@@ -597,10 +804,10 @@ async def get_contact_messages(admin_info: dict = Depends(get_admin_info)):
 
 
 @api_router.delete("/admin/messages/{message_id}")
-async def delete_contact_message(message_id: str, admin_info: dict = Depends(get_admin_info)):
+async def delete_contact_message(message_id: str, admin_info: dict = Depends(get_admin_info), db: "AsyncClient" = Depends(get_db)):
     """Delete a contact message (Admin only)"""
     try:
-        supabase.table("contact_messages").delete().eq("id", message_id).execute()
+        await execute(db.table("contact_messages").delete().eq("id", message_id))
         logger.info(f"Admin {admin_info['admin_id']} deleted message {message_id}")
         return {"success": True}
     except Exception as e:
@@ -610,10 +817,10 @@ async def delete_contact_message(message_id: str, admin_info: dict = Depends(get
 
 # Profile Endpoints
 @api_router.get("/profile")
-async def get_profile(user_id: Annotated[str, Depends(verify_jwt)]):
+async def get_profile(user_id: Annotated[str, Depends(verify_jwt)], db: "AsyncClient" = Depends(get_db)):
     """Get user profile"""
     try:
-        response = supabase.table("profiles").select("*").eq("id", user_id).execute()
+        response = await execute(db.table("profiles").select("*").eq("id", user_id))
         
         if not response.data:
             # Create profile if it doesn't exist
@@ -622,7 +829,7 @@ async def get_profile(user_id: Annotated[str, Depends(verify_jwt)]):
                 "email": "",  # Will be filled by trigger
                 "full_name": None
             }
-            create_response = supabase.table("profiles").insert(profile_data).execute()
+            create_response = await execute(db.table("profiles").insert(profile_data))
             return create_response.data[0]
         
         return response.data[0]
@@ -634,7 +841,8 @@ async def get_profile(user_id: Annotated[str, Depends(verify_jwt)]):
 @api_router.put("/profile")
 async def update_profile(
     user_id: Annotated[str, Depends(verify_jwt)],
-    profile_data: UpdateProfileRequest
+    profile_data: UpdateProfileRequest,
+    db: "AsyncClient" = Depends(get_db)
 ):
     """Update user profile"""
     try:
@@ -649,7 +857,7 @@ async def update_profile(
         
         update_data["updated_at"] = "now()"
         
-        response = supabase.table("profiles").update(update_data).eq("id", user_id).execute()
+        response = await execute(db.table("profiles").update(update_data).eq("id", user_id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Profile not found")
@@ -663,33 +871,60 @@ async def update_profile(
 
 
 # Order Endpoints
+# Product columns embedded in order line items: enough to render a history row
+ORDER_ITEM_PRODUCT_FIELDS = "id,name,category,image_url,image_variants"
+ORDER_ITEMS_EMBED = f"items:order_items(*, products({ORDER_ITEM_PRODUCT_FIELDS}))"
+
+
 @api_router.get("/orders")
-async def get_user_orders(user_id: Annotated[str, Depends(verify_jwt)]):
-    """Get all orders for authenticated user"""
+async def get_user_orders(
+    response: Response,
+    user_id: Annotated[str, Depends(verify_jwt)],
+    limit: int = Query(settings.orders_page_size, ge=1, le=settings.orders_max_page_size),
+    cursor: Optional[str] = None,
+    include: Optional[Literal["items"]] = None,
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Get one page of orders for authenticated user, newest first. With include=items
+    each order carries its line items (and slim product details) from the same query.
+    The cursor for the next page is sent in X-Next-Cursor."""
     try:
-        response = supabase.table("orders").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-        return response.data
+        columns = f"*, {ORDER_ITEMS_EMBED}" if include == "items" else "*"
+        query = apply_keyset(db.table("orders").select(columns).eq("user_id", user_id), "created_at", True, cursor)
+        # Fetch one extra row to know whether another page exists
+        result = await execute(query.limit(limit + 1))
+        orders, next_cursor = paginate(result.data or [], limit, "created_at")
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return orders
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching orders: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch orders")
 
 
 @api_router.get("/orders/{order_id}")
-async def get_order(order_id: str, user_id: Annotated[str, Depends(verify_jwt)]):
-    """Get specific order with items"""
+async def get_order(order_id: str, user_id: Annotated[str, Depends(verify_jwt)], db: "AsyncClient" = Depends(get_db)):
+    """Get specific order with items and slim product details in one query.
+    Completed orders are immutable, so they are cached per user."""
+    cache_key = f"{user_id}:{order_id}"
+    cached = order_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        # Get order
-        order_response = supabase.table("orders").select("*").eq("id", order_id).eq("user_id", user_id).execute()
+        version = order_cache.version
+        order_response = await execute(
+            db.table("orders").select(f"*, {ORDER_ITEMS_EMBED}").eq("id", order_id).eq("user_id", user_id)
+        )
         
         if not order_response.data:
             raise HTTPException(status_code=404, detail="Order not found")
         
         order = order_response.data[0]
-        
-        # Get order items with product details
-        items_response = supabase.table("order_items").select("*, products(*)").eq("order_id", order_id).execute()
-        order["items"] = items_response.data
-        
+        if order.get("status") == "completed":
+            order_cache.set(cache_key, order, version)
         return order
     except HTTPException:
         raise
@@ -699,61 +934,71 @@ async def get_order(order_id: str, user_id: Annotated[str, Depends(verify_jwt)])
 
 
 # Payment Endpoints
+# Postgres error codes raised by create_order_with_items (see supabase_setup.sql)
+ORDER_RPC_ERRORS = {
+    "P0002": 404,  # product not found
+    "22023": 400,  # empty or malformed cart
+    "23514": 400,  # check constraint, e.g. quantity <= 0
+    "PT409": 409,  # not enough stock for a line
+}
+
+
+async def create_order_with_items(db: "AsyncClient", user_id: str, items: List[OrderItem]) -> dict:
+    """Price the cart, reserve stock and insert the order with its items in one transactional RPC"""
+    from postgrest.exceptions import APIError  # Loaded with the Supabase client, not at import
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="Order must contain at least one item")
+    
+    try:
+        response = await execute(db.rpc("create_order_with_items", {
+            "p_user_id": user_id,
+            "p_items": [item.model_dump() for item in items],
+            "p_hold_minutes": settings.reservation_hold_minutes,
+        }))
+    except APIError as e:
+        status_code = ORDER_RPC_ERRORS.get(e.code)
+        if status_code is None:
+            raise
+        raise HTTPException(status_code=status_code, detail=e.message)
+    
+    if not response.data:
+        raise HTTPException(status_code=500, detail="Failed to create order")
+    return response.data
+
+
+def mark_replayed(response: Response, replayed: bool) -> None:
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+
+
 @api_router.post("/payments/create-order")
 async def create_razorpay_order(
     user_id: Annotated[str, Depends(verify_jwt)],
-    request_data: CreateRazorpayOrderRequest
+    request_data: CreateRazorpayOrderRequest,
+    response: Response,
+    idempotency_key: Annotated[Optional[str], Header()] = None,
+    db: "AsyncClient" = Depends(get_db)
 ):
-    """Create Razorpay order and store in database"""
+    """Create Razorpay order and store in database. Retries with the same
+    Idempotency-Key return the original order instead of creating another."""
+    result, replayed = await run_idempotent(
+        db,
+        f"{user_id}:create-order",
+        idempotency_key,
+        request_data.model_dump(mode="json"),
+        lambda: _create_razorpay_order(db, user_id, request_data),
+    )
+    mark_replayed(response, replayed)
+    return result
+
+
+async def _create_razorpay_order(db: "AsyncClient", user_id: str, request_data: CreateRazorpayOrderRequest) -> dict:
     try:
-        # Calculate total amount and validate products
-        total_amount = 0
-        order_items_data = []
-        
-        for item in request_data.items:
-            product_response = supabase.table("products").select("*").eq("id", item.product_id).execute()
-            
-            if not product_response.data:
-                raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-            
-            product = product_response.data[0]
-            item_total = float(product["price"]) * item.quantity
-            total_amount += item_total
-            
-            order_items_data.append({
-                "product_id": item.product_id,
-                "quantity": item.quantity,
-                "unit_price": float(product["price"]),
-                "size": item.size,
-                "color": item.color
-            })
-        
-        # Create order in database first
-        order_data = {
-            "user_id": user_id,
-            "status": "pending",
-            "total_amount": total_amount,
-            "payment_status": "pending"
-        }
-        
-        order_response = supabase.table("orders").insert(order_data).execute()
-        
-        if not order_response.data:
-            raise HTTPException(status_code=500, detail="Failed to create order")
-        
-        order_id = order_response.data[0]["id"]
-        
-        # Add order_id to order items
-        for item_data in order_items_data:
-            item_data["order_id"] = order_id
-        
-        # Insert order items
-        items_response = supabase.table("order_items").insert(order_items_data).execute()
-        
-        if not items_response.data:
-            # Rollback order
-            supabase.table("orders").delete().eq("id", order_id).execute()
-            raise HTTPException(status_code=500, detail="Failed to create order items")
+        # Price the cart and create the order with its items atomically
+        order = await create_order_with_items(db, user_id, request_data.items)
+        order_id = order["id"]
+        total_amount = float(order["total_amount"])
         
         # Create Razorpay order (lazy client - may be None on some hosts)
         razorpay_order_data = {
@@ -762,21 +1007,17 @@ async def create_razorpay_order(
             "payment_capture": 1
         }
         
-        client = _get_razorpay_client()
         try:
-            if client:
-                razorpay_order = client.order.create(data=razorpay_order_data)
-                supabase.table("orders").update({
-                    "payment_id": razorpay_order["id"]
-                }).eq("id", order_id).execute()
-            else:
-                raise RuntimeError("Razorpay not available")
+            razorpay_order = await create_gateway_order(razorpay_order_data)
+            await execute(db.table("orders").update({
+                "payment_id": razorpay_order["id"]
+            }).eq("id", order_id))
         except Exception as razorpay_error:
             logger.warning(f"Razorpay order creation failed (mock mode): {str(razorpay_error)}")
             mock_razorpay_order_id = f"order_mock_{order_id[:8]}"
-            supabase.table("orders").update({
+            await execute(db.table("orders").update({
                 "payment_id": mock_razorpay_order_id
-            }).eq("id", order_id).execute()
+            }).eq("id", order_id))
             razorpay_order = {
                 "id": mock_razorpay_order_id,
                 "amount": int(total_amount * 100),
@@ -800,46 +1041,89 @@ async def create_razorpay_order(
 @api_router.post("/payments/verify")
 async def verify_payment(
     user_id: Annotated[str, Depends(verify_jwt)],
-    payment_data: VerifyPaymentRequest
+    payment_data: VerifyPaymentRequest,
+    response: Response,
+    idempotency_key: Annotated[Optional[str], Header()] = None,
+    db: "AsyncClient" = Depends(get_db)
 ):
-    """Verify Razorpay payment and update order status"""
+    """Verify Razorpay payment and update order status. Retries with the same
+    Idempotency-Key replay the first result."""
+    result, replayed = await run_idempotent(
+        db,
+        f"{user_id}:verify",
+        idempotency_key,
+        payment_data.model_dump(mode="json"),
+        lambda: _verify_payment(db, user_id, payment_data),
+    )
+    mark_replayed(response, replayed)
+    return result
+
+
+async def _verify_payment(db: "AsyncClient", user_id: str, payment_data: VerifyPaymentRequest) -> dict:
     try:
-        # Verify order belongs to user (authentication required)
-        order_response = supabase.table("orders").select("*").eq("id", payment_data.order_id).eq("user_id", user_id).execute()
-        
-        if not order_response.data:
-            raise HTTPException(status_code=404, detail="Order not found")
-        
-        # Verify Razorpay signature (lazy client - may be None)
-        client = _get_razorpay_client()
-        try:
-            if client:
-                params_dict = {
-                    "razorpay_order_id": payment_data.razorpay_order_id,
-                    "razorpay_payment_id": payment_data.razorpay_payment_id,
-                    "razorpay_signature": payment_data.razorpay_signature
-                }
+        # Verify Razorpay signature (lazy client - None in mock mode, which accepts any payment)
+        client = get_razorpay_client()
+        payment_verified = True
+        if client:
+            params_dict = {
+                "razorpay_order_id": payment_data.razorpay_order_id,
+                "razorpay_payment_id": payment_data.razorpay_payment_id,
+                "razorpay_signature": payment_data.razorpay_signature
+            }
+            try:
                 client.utility.verify_payment_signature(params_dict)
-            payment_verified = True
-        except Exception as verify_error:
-            logger.warning(f"Razorpay signature verification failed (mock mode): {str(verify_error)}")
-            payment_verified = True
-        
-        # Update order status
-        update_data = {
-            "status": "completed" if payment_verified else "failed",
-            "payment_status": "paid" if payment_verified else "failed",
-            "payment_id": payment_data.razorpay_payment_id,
-            "updated_at": "now()"
-        }
-        
-        supabase.table("orders").update(update_data).eq("id", payment_data.order_id).execute()
-        
-        return {
-            "success": payment_verified,
-            "message": "Payment verified successfully" if payment_verified else "Payment verification failed",
-            "order_id": payment_data.order_id
-        }
+            except Exception as verify_error:
+                logger.warning(f"Razorpay signature verification failed for order {payment_data.order_id}: {str(verify_error)}")
+                payment_verified = False
+        
+        if not payment_verified:
+            # Only an unpaid order that still holds its stock can fail; a forged signature
+            # must not undo a paid order, and the caller's payment_id is never stored
+            response = await execute(
+                db.table("orders").update({"payment_status": "failed", "updated_at": "now()"})
+                .eq("id", payment_data.order_id).eq("user_id", user_id)
+                .neq("payment_status", "paid").eq("stock_released", False)
+            )
+            if response.data:
+                # Put the reserved stock back (also marks the order failed)
+                await release_order_stock(db, payment_data.order_id, "failed")
+            else:
+                owned = await execute(
+                    db.table("orders").select("id").eq("id", payment_data.order_id).eq("user_id", user_id)
+                )
+                if not owned.data:
+                    raise HTTPException(status_code=404, detail="Order not found")
+            return {"success": False, "message": "Payment verification failed", "order_id": payment_data.order_id}
+        
+        # Common case, one round trip: the stock is still held, so the order is complete
+        response = await execute(
+            db.table("orders").update({
+                "status": "completed",
+                "payment_status": "paid",
+                "payment_id": payment_data.razorpay_payment_id,
+                "updated_at": "now()"
+            }).eq("id", payment_data.order_id).eq("user_id", user_id).eq("stock_released", False)
+        )
+        if response.data:
+            return {"success": True, "message": "Payment verified successfully", "order_id": payment_data.order_id}
+        
+        # Nothing matched: not this user's order, or its hold expired before payment
+        response = await execute(
+            db.table("orders").update({
+                "payment_status": "paid",
+                "payment_id": payment_data.razorpay_payment_id,
+                "updated_at": "now()"
+            }).eq("id", payment_data.order_id).eq("user_id", user_id)
+        )
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Order not found")
+        # Take the stock back, or flag the order for refund
+        status = await settle_late_payment(db, payment_data.order_id)
+        await execute(db.table("orders").update({"status": status, "updated_at": "now()"}).eq("id", payment_data.order_id))
+        if status == "needs_refund":
+            message = "Payment received, but the items sold out after the reservation expired. The payment will be refunded."
+            return {"success": False, "message": message, "order_id": payment_data.order_id}
+        return {"success": True, "message": "Payment verified successfully", "order_id": payment_data.order_id}
         
     except HTTPException:
         raise
@@ -850,32 +1134,56 @@ async def verify_payment(
 
 @api_router.post("/payments/webhook")
 async def razorpay_webhook(request: Request):
-    """Handle Razorpay webhooks"""
+    """Verify and enqueue a Razorpay webhook. With the in-process worker running it is
+    acknowledged right away; otherwise (serverless) it is applied before acknowledging."""
+    payload = await request.body()
+    signature = request.headers.get("X-Razorpay-Signature", "")
+    
+    if settings.razorpay_webhook_secret == "mock_webhook_secret":
+        if not settings.razorpay_webhook_allow_unsigned:
+            # Non-2xx: Razorpay keeps redelivering until the secret is configured
+            logger.error("Webhook secret not configured - rejecting webhook (set RAZORPAY_WEBHOOK_SECRET)")
+            raise HTTPException(status_code=503, detail="Webhook secret not configured")
+        logger.warning("Webhook secret not configured - accepting unsigned webhook (RAZORPAY_WEBHOOK_ALLOW_UNSIGNED)")
+    else:
+        expected = hmac.new(settings.razorpay_webhook_secret.encode(), payload, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
     try:
-        payload = await request.body()
-        signature = request.headers.get("X-Razorpay-Signature", "")
-        
-        # Verify webhook signature (lazy client - may be None)
-        client = _get_razorpay_client()
-        try:
-            if client:
-                client.utility.verify_webhook_signature(
-                    payload.decode(),
-                    signature,
-                    settings.razorpay_webhook_secret
-                )
-        except Exception as e:
-            logger.warning(f"Webhook signature verification failed: {str(e)}")
-        
-        # Process webhook event
-        # This is a basic implementation - expand based on your needs
-        logger.info(f"Received Razorpay webhook: {payload.decode()}")
-        
-        return {"status": "processed"}
-        
+        event_id = event_id_for(request.headers.get("X-Razorpay-Event-Id"), payload)
+        queued = await enqueue_event(event_id, payload)
+    except Exception as e:
+        logger.error(f"Error queueing webhook: {str(e)}")
+        # Non-2xx makes Razorpay redeliver later
+        raise HTTPException(status_code=500, detail="Failed to queue webhook")
+    
+    if webhook_worker_running():
+        return {"status": "queued" if queued else "duplicate", "event_id": event_id}
+    
+    # No worker (serverless): the queue file lives in per-instance /tmp and nothing
+    # would retry it after the response, so apply now and let Razorpay redeliver on failure
+    db = await get_db()
+    await drain_queue(db)
+    if not await asyncio.to_thread(webhook_queue.is_processed, event_id):
+        raise HTTPException(status_code=500, detail="Failed to apply webhook")
+    return {"status": "processed", "event_id": event_id}
+
+
+@api_router.post("/admin/webhooks/drain")
+async def drain_webhooks(
+    max_batches: int = Query(10, ge=1, le=100),
+    admin_info: dict = Depends(get_admin_info),
+    db: "AsyncClient" = Depends(get_db)
+):
+    """Apply queued Razorpay webhook events now and report queue depth (Admin only)"""
+    try:
+        report = await drain_queue(db, max_batches)
+        queue = await asyncio.to_thread(webhook_queue.stats)
+        return {"success": True, **report, "queue": queue}
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to process webhook")
+        logger.error(f"Error draining webhook queue: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to drain webhooks: {str(e)}")
 
 
 # Include router
@@ -907,6 +1215,61 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Per-request Supabase round-trip accounting
+app.add_middleware(QueryStatsMiddleware)
+
+# Outermost, so CORS preflights and error responses are timed too
+app.add_middleware(MetricsMiddleware)
+
 
 # Note: Startup/shutdown events are disabled for serverless (lifespan="off" in Mangum)
-# These will not run in Vercel serverless functions
+# These will not run in Vercel serverless functions; the first query surfaces
+# any connection problem there instead.
+background_tasks: List[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def verify_supabase_connection():
+    """Create the Supabase client and test the connection before serving.
+    Long-running servers only: Vercel runs with lifespan off, so there the
+    client is created by the first request that needs it."""
+    await check_connection()
+
+
+@app.on_event("startup")
+async def start_reservation_sweeper():
+    """Release expired stock reservations periodically"""
+    if database.get_supabase() is not None and settings.reservation_sweep_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(
+            run_reservation_sweeper(database.supabase, settings.reservation_sweep_interval_seconds)
+        ))
+
+
+@app.on_event("startup")
+async def start_webhook_worker():
+    """Drain queued Razorpay webhooks continuously"""
+    if database.get_supabase() is not None and settings.webhook_drain_interval_seconds > 0:
+        webhook_task = asyncio.create_task(
+            run_webhook_worker(database.supabase, settings.webhook_drain_interval_seconds)
+        )
+        webhook_task.set_name("webhook_worker")
+        background_tasks.append(webhook_task)
+
+
+def webhook_worker_running() -> bool:
+    return any(task.get_name() == "webhook_worker" and not task.done() for task in background_tasks)
+
+
+@app.on_event("startup")
+async def start_readiness_probe():
+    """Keep the cached readiness result fresh"""
+    if settings.health_probe_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(readiness.run()))
+
+
+@app.on_event("shutdown")
+async def close_supabase_connections():
+    """Stop background tasks and release pooled Supabase connections"""
+    for task in background_tasks:
+        task.cancel()
+    await close_supabase()
@@ -22,6 +22,7 @@ create table if not exists products (
   description text,
   price numeric(10, 2) not null,
   image_url text,
+  image_variants jsonb,  -- {"320": url, "640": url, ...} WebP derivatives for srcset
   category text not null,
   sizes text[] not null default '{}',
   colors text[] not null default '{}',
@@ -30,6 +31,9 @@ create table if not exists products (
   updated_at timestamp with time zone default now()
 );
 
+-- Add columns introduced after the initial schema (safe to re-run)
+alter table products add column if not exists image_variants jsonb;
+
 -- Create orders table
 -- Note: user_id can be a UUID (authenticated user) or text 'guest_user' (guest checkout)
 create table if not exists orders (
@@ -55,11 +59,30 @@ create table if not exists order_items (
   created_at timestamp with time zone default now()
 );
 
+-- Order history is read per user, newest first (keyset on created_at, id);
+-- line items are embedded by order_id
+create index if not exists orders_user_created_idx on orders (user_id, created_at desc, id desc);
+create index if not exists order_items_order_id_idx on order_items (order_id);
+
+-- Idempotency keys for checkout/payment retries (used when IDEMPOTENCY_STORE=table)
+-- key is scoped as "<user_id>:<endpoint>:<Idempotency-Key header>"
+create table if not exists idempotency_keys (
+  key text primary key,
+  fingerprint text not null,  -- sha256 of the request body
+  status text not null default 'pending',  -- pending | completed
+  response jsonb,
+  created_at timestamp with time zone default now(),
+  expires_at timestamp with time zone not null
+);
+create index if not exists idempotency_keys_expires_at_idx on idempotency_keys (expires_at);
+
 -- Enable Row Level Security
 alter table profiles enable row level security;
 alter table products enable row level security;
 alter table orders enable row level security;
 alter table order_items enable row level security;
+-- No policies: only the service role (backend) can read or write idempotency keys
+alter table idempotency_keys enable row level security;
 
 -- RLS Policies for profiles
 DROP POLICY IF EXISTS "Users can read their own profile" ON profiles;
@@ -151,6 +174,284 @@ ON CONFLICT (id) DO UPDATE SET
   colors = EXCLUDED.colors,
   stock_quantity = EXCLUDED.stock_quantity;
 
+-- Stock reservation bookkeeping on orders
+alter table orders add column if not exists reservation_expires_at timestamp with time zone;
+alter table orders add column if not exists stock_released boolean not null default false;
+
+-- Atomic checkout: price the cart from the products table, reserve stock with
+-- a conditional decrement, then insert the order and its items, all in one
+-- transaction (a single RPC round trip). Raises SQLSTATE PT409 (HTTP 409 in
+-- PostgREST) when any line is short of stock; nothing is written in that case.
+-- p_items: [{"product_id": "1", "quantity": 2, "size": "M", "color": "Black"}, ...]
+drop function if exists public.create_order_with_items(text, jsonb);
+create or replace function public.create_order_with_items(
+  p_user_id text,
+  p_items jsonb,
+  p_hold_minutes integer default 15
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_order orders;
+  v_missing text;
+  v_short text;
+  v_total numeric(10, 2);
+begin
+  if p_items is null or jsonb_typeof(p_items) <> 'array' or jsonb_array_length(p_items) = 0 then
+    raise exception 'Order must contain at least one item' using errcode = '22023';
+  end if;
+
+  select i.product_id into v_missing
+  from jsonb_to_recordset(p_items) as i(product_id text)
+  left join products p on p.id = i.product_id
+  where p.id is null
+  limit 1;
+
+  if v_missing is not null then
+    raise exception 'Product % not found', v_missing using errcode = 'P0002';
+  end if;
+
+  -- Lock the cart's products in a fixed order so concurrent checkouts cannot
+  -- deadlock; buyers of different products never wait on each other
+  perform 1
+  from products
+  where id in (select i.product_id from jsonb_to_recordset(p_items) as i(product_id text))
+  order by id
+  for update;
+
+  select w.product_id into v_short
+  from (
+    select i.product_id, sum(i.quantity) as quantity
+    from jsonb_to_recordset(p_items) as i(product_id text, quantity integer)
+    group by i.product_id
+  ) w
+  join products p on p.id = w.product_id
+  where coalesce(p.stock_quantity, 0) < w.quantity
+  order by w.product_id
+  limit 1;
+
+  if v_short is not null then
+    raise exception 'Product % is out of stock', v_short using errcode = 'PT409';
+  end if;
+
+  update products p
+  set stock_quantity = p.stock_quantity - w.quantity,
+      updated_at = now()
+  from (
+    select i.product_id, sum(i.quantity) as quantity
+    from jsonb_to_recordset(p_items) as i(product_id text, quantity integer)
+    group by i.product_id
+  ) w
+  where p.id = w.product_id;
+
+  select coalesce(sum(p.price * i.quantity), 0) into v_total
+  from jsonb_to_recordset(p_items) as i(product_id text, quantity integer)
+  join products p on p.id = i.product_id;
+
+  insert into orders (user_id, status, total_amount, payment_status, reservation_expires_at)
+  values (p_user_id, 'pending', v_total, 'pending', now() + make_interval(mins => p_hold_minutes))
+  returning * into v_order;
+
+  insert into order_items (order_id, product_id, quantity, unit_price, size, color)
+  select v_order.id, i.product_id, i.quantity, p.price, i.size, i.color
+  from jsonb_to_recordset(p_items) as i(product_id text, quantity integer, size text, color text)
+  join products p on p.id = i.product_id;
+
+  return to_jsonb(v_order);
+end;
+$$;
+
+-- Return an unpaid order's reserved stock. Idempotent: returns false if the
+-- order is paid, unknown, or already released.
+create or replace function public.release_order_stock(p_order_id uuid, p_status text default 'cancelled')
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_order_id uuid;
+begin
+  update orders
+  set stock_released = true,
+      status = p_status,
+      updated_at = now()
+  where id = p_order_id
+    and payment_status <> 'paid'
+    and not stock_released
+  returning id into v_order_id;
+
+  if v_order_id is null then
+    return false;
+  end if;
+
+  -- Same lock order as create_order_with_items
+  perform 1
+  from products
+  where id in (select product_id from order_items where order_id = p_order_id)
+  order by id
+  for update;
+
+  update products p
+  set stock_quantity = p.stock_quantity + r.quantity,
+      updated_at = now()
+  from (
+    select product_id, sum(quantity) as quantity
+    from order_items
+    where order_id = p_order_id
+    group by product_id
+  ) r
+  where p.id = r.product_id;
+
+  return true;
+end;
+$$;
+
+-- Take the stock back for an order whose hold was released (e.g. it expired)
+-- before the payment arrived, with the same conditional decrement as checkout.
+-- Returns false, changing nothing, if any item is now out of stock; true if
+-- the stock is reserved again or was never released.
+create or replace function public.reserve_order_stock(p_order_id uuid)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_released boolean;
+  v_short text;
+begin
+  select stock_released into v_released
+  from orders
+  where id = p_order_id
+  for update;
+
+  if not coalesce(v_released, false) then
+    return true;
+  end if;
+
+  -- Same lock order as create_order_with_items
+  perform 1
+  from products
+  where id in (select product_id from order_items where order_id = p_order_id)
+  order by id
+  for update;
+
+  select r.product_id into v_short
+  from (
+    select product_id, sum(quantity) as quantity
+    from order_items
+    where order_id = p_order_id
+    group by product_id
+  ) r
+  join products p on p.id = r.product_id
+  where coalesce(p.stock_quantity, 0) < r.quantity
+  limit 1;
+
+  if v_short is not null then
+    return false;
+  end if;
+
+  update products p
+  set stock_quantity = p.stock_quantity - r.quantity,
+      updated_at = now()
+  from (
+    select product_id, sum(quantity) as quantity
+    from order_items
+    where order_id = p_order_id
+    group by product_id
+  ) r
+  where p.id = r.product_id;
+
+  update orders
+  set stock_released = false,
+      updated_at = now()
+  where id = p_order_id;
+
+  return true;
+end;
+$$;
+
+-- Release reservations of unpaid orders whose hold has expired. Safe to run
+-- concurrently (skip locked); schedule with pg_cron or call from the backend.
+create or replace function public.release_expired_reservations(p_limit integer default 100)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_order record;
+  v_released integer := 0;
+begin
+  for v_order in
+    select id
+    from orders
+    where payment_status <> 'paid'  -- pending, or failed by a payment.failed webhook
+      and not stock_released
+      and reservation_expires_at < now()
+    order by reservation_expires_at
+    limit p_limit
+    for update skip locked
+  loop
+    if public.release_order_stock(v_order.id, 'expired') then
+      v_released := v_released + 1;
+    end if;
+  end loop;
+
+  return v_released;
+end;
+$$;
+
+-- Admin batch patch: p_updates is [{"id", "price", "stock_quantity", "stock_delta"}];
+-- absent keys leave the column unchanged and stock never goes below zero.
+-- Returns the ids that exist (and were updated); the caller reports the rest as missing.
+create or replace function public.batch_update_products(p_updates jsonb)
+returns text[]
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_ids text[];
+begin
+  -- Same lock order as create_order_with_items
+  perform 1
+  from products
+  where id in (select u.id from jsonb_to_recordset(p_updates) as u(id text))
+  order by id
+  for update;
+
+  with updated as (
+    update products p
+    set price = coalesce(u.price, p.price),
+        stock_quantity = greatest(coalesce(u.stock_quantity, p.stock_quantity, 0) + coalesce(u.stock_delta, 0), 0),
+        updated_at = now()
+    from jsonb_to_recordset(p_updates) as u(id text, price numeric, stock_quantity integer, stock_delta integer)
+    where p.id = u.id
+    returning p.id
+  )
+  select coalesce(array_agg(id order by id), '{}') into v_ids from updated;
+
+  return v_ids;
+end;
+$$;
+
+-- Only the backend (service role) may call the checkout and inventory functions
+revoke execute on function public.create_order_with_items(text, jsonb, integer) from public, anon, authenticated;
+grant execute on function public.create_order_with_items(text, jsonb, integer) to service_role;
+revoke execute on function public.release_order_stock(uuid, text) from public, anon, authenticated;
+grant execute on function public.release_order_stock(uuid, text) to service_role;
+revoke execute on function public.reserve_order_stock(uuid) from public, anon, authenticated;
+grant execute on function public.reserve_order_stock(uuid) to service_role;
+revoke execute on function public.release_expired_reservations(integer) from public, anon, authenticated;
+grant execute on function public.release_expired_reservations(integer) to service_role;
+revoke execute on function public.batch_update_products(jsonb) from public, anon, authenticated;
+grant execute on function public.batch_update_products(jsonb) to service_role;
+
 -- Function to automatically create profile on user signup
 create or replace function public.handle_new_user()
 returns trigger as $$
@@ -0,0 +1,283 @@
+"""
+Durable queue for Razorpay webhooks.
+
+The webhook endpoint verifies the signature and appends the raw event to a
+local SQLite (WAL) file. On a long-running server it then acknowledges and a
+background worker drains the queue in batches: duplicate deliveries are
+dropped by Razorpay event id on insert, and each batch is applied to the
+orders table with one bulk update per target status instead of one write
+per event. A batch that fails is retried event by event, so one bad event
+only uses up its own attempts; an event that ran out of attempts gets a
+fresh set when Razorpay redelivers it. On serverless there is no worker and /tmp does not outlive the
+instance, so the endpoint drains before acknowledging and answers 5xx when
+the event was not applied, leaving retries to Razorpay.
+"""
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import get_settings
+from database import execute, is_vercel
+from inventory import settle_late_payment
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PAID_EVENTS = {"payment.captured", "order.paid"}
+FAILED_EVENTS = {"payment.failed"}
+
+_SCHEMA = """
+create table if not exists webhook_events (
+    event_id text primary key,
+    event_type text,
+    payload text not null,
+    received_at real not null,
+    processed_at real,
+    attempts integer not null default 0,
+    last_error text
+);
+create index if not exists webhook_events_pending_idx
+    on webhook_events (processed_at, received_at);
+"""
+
+
+def default_queue_path() -> str:
+    # The deployment bundle is read-only on Vercel; /tmp is the only writable path
+    if is_vercel():
+        return "/tmp/razorpay_webhooks.sqlite3"
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "razorpay_webhooks.sqlite3")
+
+
+class WebhookQueue:
+    """Append-only SQLite queue of webhook events, keyed by event id"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def enqueue(self, event_id: str, event_type: Optional[str], payload: str) -> bool:
+        """Store an event. False if this event id was already received; a redelivery
+        of an event that ran out of attempts makes it pending again."""
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "insert or ignore into webhook_events (event_id, event_type, payload, received_at) values (?, ?, ?, ?)",
+                (event_id, event_type, payload, time.time()),
+            )
+            if cursor.rowcount == 1:
+                return True
+            conn.execute(
+                "update webhook_events set attempts = 0 where event_id = ? and processed_at is null and attempts >= ?",
+                (event_id, settings.webhook_max_attempts),
+            )
+            return False
+
+    def next_batch(self, limit: int) -> List[Tuple[str, str]]:
+        """Oldest unprocessed events that still have attempts left"""
+        with self._lock:
+            return self._connection().execute(
+                "select event_id, payload from webhook_events "
+                "where processed_at is null and attempts < ? order by received_at limit ?",
+                (settings.webhook_max_attempts, limit),
+            ).fetchall()
+
+    def mark_processed(self, event_ids: List[str]) -> None:
+        with self._lock:
+            self._connection().executemany(
+                "update webhook_events set processed_at = ? where event_id = ?",
+                [(time.time(), event_id) for event_id in event_ids],
+            )
+
+    def mark_failed(self, event_ids: List[str], error: str) -> None:
+        with self._lock:
+            self._connection().executemany(
+                "update webhook_events set attempts = attempts + 1, last_error = ? where event_id = ?",
+                [(error, event_id) for event_id in event_ids],
+            )
+
+    def is_processed(self, event_id: str) -> bool:
+        with self._lock:
+            row = self._connection().execute(
+                "select processed_at is not null from webhook_events where event_id = ?", (event_id,)
+            ).fetchone()
+            return bool(row and row[0])
+
+    def purge(self, older_than_seconds: float) -> int:
+        """Forget processed events (their ids stop deduplicating after this)"""
+        with self._lock:
+            cursor = self._connection().execute(
+                "delete from webhook_events where processed_at is not null and processed_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending, processed, dead = self._connection().execute(
+                "select "
+                "coalesce(sum(processed_at is null and attempts < ?), 0), "
+                "coalesce(sum(processed_at is not null), 0), "
+                "coalesce(sum(processed_at is null and attempts >= ?), 0) "
+                "from webhook_events",
+                (settings.webhook_max_attempts, settings.webhook_max_attempts),
+            ).fetchone()
+            return {"pending": pending, "processed": processed, "dead": dead}
+
+
+webhook_queue = WebhookQueue(settings.webhook_queue_path or default_queue_path())
+_drain_lock = asyncio.Lock()
+
+
+def event_id_for(header_event_id: Optional[str], payload: bytes) -> str:
+    """Razorpay's X-Razorpay-Event-Id, or a hash of the body for older deliveries"""
+    if header_event_id:
+        return header_event_id
+    return "sha256:" + hashlib.sha256(payload).hexdigest()
+
+
+async def enqueue_event(event_id: str, payload: bytes) -> bool:
+    """Append a verified webhook to the queue. False for a duplicate delivery."""
+    try:
+        event_type = json.loads(payload).get("event")
+    except (ValueError, AttributeError):
+        event_type = None
+    return await asyncio.to_thread(webhook_queue.enqueue, event_id, event_type, payload.decode())
+
+
+def _payment_refs(event: Dict[str, Any]) -> Set[str]:
+    """Gateway ids an event can be matched on (orders.payment_id holds the
+    Razorpay order id until checkout verification replaces it with the payment id)"""
+    payload = event.get("payload") or {}
+    payment = (payload.get("payment") or {}).get("entity") or {}
+    order = (payload.get("order") or {}).get("entity") or {}
+    return {ref for ref in (payment.get("order_id"), payment.get("id"), order.get("id")) if ref}
+
+
+async def apply_events(db: "AsyncClient", events: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Apply a batch of webhook events with one bulk write per target status"""
+    paid_refs: Set[str] = set()
+    failed_refs: Set[str] = set()
+    for event in events:
+        if event.get("event") in PAID_EVENTS:
+            paid_refs |= _payment_refs(event)
+        elif event.get("event") in FAILED_EVENTS:
+            failed_refs |= _payment_refs(event)
+    # A captured retry supersedes an earlier failed attempt on the same order
+    failed_refs -= paid_refs
+
+    paid = failed = 0
+    if paid_refs:
+        response = await execute(
+            db.table("orders")
+            .update({"status": "completed", "payment_status": "paid", "updated_at": "now()"})
+            .in_("payment_id", sorted(paid_refs))
+            .neq("payment_status", "paid")
+            .eq("stock_released", False)
+        )
+        paid = len(response.data or [])
+        # Orders whose hold expired before payment: re-reserve their stock one by one
+        late = await execute(
+            db.table("orders").select("id")
+            .in_("payment_id", sorted(paid_refs))
+            .neq("payment_status", "paid")
+            .eq("stock_released", True)
+        )
+        for row in late.data or []:
+            status = await settle_late_payment(db, row["id"])
+            await execute(
+                db.table("orders")
+                .update({"status": status, "payment_status": "paid", "updated_at": "now()"})
+                .eq("id", row["id"])
+            )
+            paid += 1
+    if failed_refs:
+        # Razorpay lets the customer retry on the same order, so only the payment is
+        # marked failed; the stock hold is released by the reservation sweeper
+        response = await execute(
+            db.table("orders")
+            .update({"payment_status": "failed", "updated_at": "now()"})
+            .in_("payment_id", sorted(failed_refs))
+            .eq("payment_status", "pending")
+        )
+        failed = len(response.data or [])
+    return {"paid": paid, "failed": failed}
+
+
+async def _apply_batch(db: "AsyncClient", batch: List[Tuple[str, str]], report: Dict[str, int]) -> bool:
+    """Apply a batch and mark it processed; on failure retry event by event so one
+    bad event does not use up the attempts of the others. False if any event failed."""
+    event_ids = [event_id for event_id, _ in batch]
+    events = []
+    for _, payload in batch:
+        try:
+            events.append(json.loads(payload))
+        except ValueError:
+            logger.warning("Skipping malformed webhook payload")
+    try:
+        applied = await apply_events(db, events)
+    except Exception as e:
+        if len(batch) == 1:
+            logger.error(f"Webhook event {event_ids[0]} failed: {str(e)}")
+            await asyncio.to_thread(webhook_queue.mark_failed, event_ids, str(e))
+            report["errors"] += 1
+            return False
+        logger.warning(f"Webhook batch failed ({len(batch)} events), retrying one by one: {str(e)}")
+        ok = True
+        for item in batch:
+            ok = await _apply_batch(db, [item], report) and ok
+        return ok
+    await asyncio.to_thread(webhook_queue.mark_processed, event_ids)
+    report["events"] += len(batch)
+    report["paid"] += applied["paid"]
+    report["failed"] += applied["failed"]
+    return True
+
+
+async def drain_queue(db: "AsyncClient", max_batches: Optional[int] = None) -> Dict[str, int]:
+    """Process queued events batch by batch until the queue is empty"""
+    report = {"events": 0, "paid": 0, "failed": 0, "errors": 0}
+    async with _drain_lock:
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = await asyncio.to_thread(webhook_queue.next_batch, settings.webhook_batch_size)
+            if not batch:
+                break
+            batches += 1
+            # Failed events are still pending; leave them for the next drain
+            if not await _apply_batch(db, batch, report):
+                break
+    return report
+
+
+async def run_webhook_worker(db: "AsyncClient", interval_seconds: float) -> None:
+    """Drain the webhook queue continuously (long-running servers only)"""
+    last_purge = 0.0
+    while True:
+        try:
+            report = await drain_queue(db)
+            if report["events"]:
+                logger.info(f"Processed {report['events']} webhook events")
+            if time.monotonic() - last_purge > 3600:
+                await asyncio.to_thread(webhook_queue.purge, settings.webhook_retention_hours * 3600)
+                last_purge = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Webhook worker iteration failed: {str(e)}")
+        await asyncio.sleep(interval_seconds)
@@ -1,6 +1,14 @@
 import React from 'react';
 import { Link } from 'react-router-dom';
 
+// Build a srcset from the WebP derivatives ({"320": url, ...}) stored with the product
+const buildSrcSet = (variants) =>
+  variants
+    ? Object.entries(variants)
+        .map(([width, url]) => `${url} ${width}w`)
+        .join(', ')
+    : undefined;
+
 const ProductCard = ({ product }) => {
   return (
     <Link
@@ -11,6 +19,8 @@ const ProductCard = ({ product }) => {
       <div className="relative aspect-[3/4] overflow-hidden bg-zinc-900 mb-3 sm:mb-4 rounded-sm">
         <img
           src={product.image || product.image_url}
+          srcSet={buildSrcSet(product.image_variants)}
+          sizes="(min-width: 1024px) 33vw, 50vw"
           alt={product.name}
           loading="lazy"
           decoding="async"
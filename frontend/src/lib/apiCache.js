@@ -18,6 +18,30 @@ export const cachedFetch = async (url, options = {}) => {
   return data;
 };
 
+// Fetch every page of a cursor-paginated list endpoint (next cursor in the
+// X-Next-Cursor header) and cache the combined array under the base URL
+export const cachedFetchAll = async (url, options = {}) => {
+  const cached = cache.get(url);
+
+  if (cached && Date.now() - cached.timestamp < CACHE_TTL) {
+    return cached.data;
+  }
+
+  const separator = url.includes('?') ? '&' : '?';
+  let items = [];
+  let cursor = null;
+  do {
+    const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+    const response = await fetch(pageUrl, options);
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    items = items.concat(await response.json());
+    cursor = response.headers.get('X-Next-Cursor');
+  } while (cursor);
+
+  cache.set(url, { data: items, timestamp: Date.now() });
+  return items;
+};
+
 export const invalidateCache = (url) => {
   if (url) {
     cache.delete(url);
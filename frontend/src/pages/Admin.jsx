@@ -51,7 +51,7 @@ const Admin = () => {
     // Verify credentials by trying to access admin endpoint
     setLoading(true);
     try {
-      const response = await fetch(`${BACKEND_URL}/admin/products`, {
+      const response = await fetch(`${BACKEND_URL}/admin/products?limit=1&fields=id`, {
         headers: {
           'X-Admin-Key': adminKey,
           'X-Admin-ID': adminId
@@ -130,7 +130,7 @@ const Admin = () => {
       if (storedKey && storedId) {
         // Verify stored credentials are still valid
         try {
-          const response = await fetch(`${BACKEND_URL}/admin/products`, {
+          const response = await fetch(`${BACKEND_URL}/admin/products?limit=1&fields=id`, {
             headers: {
               'X-Admin-Key': storedKey,
               'X-Admin-ID': storedId
@@ -184,18 +184,28 @@ const Admin = () => {
     
     setLoadingProducts(true);
     try {
-      const response = await fetch(`${BACKEND_URL}/admin/products`, {
-        headers: {
-          'X-Admin-Key': key,
-          'X-Admin-ID': id
-        }
-      });
+      // The list is paginated: follow next_cursor until every product is loaded
+      let data;
+      let allProducts = [];
+      let cursor = null;
+      do {
+        const query = cursor ? `?limit=200&cursor=${encodeURIComponent(cursor)}` : '?limit=200';
+        const response = await fetch(`${BACKEND_URL}/admin/products${query}`, {
+          headers: {
+            'X-Admin-Key': key,
+            'X-Admin-ID': id
+          }
+        });
 
-      const data = await response.json();
-      
-      if (!response.ok) {
-        throw new Error(data.detail || 'Failed to load products');
-      }
+        data = await response.json();
+        
+        if (!response.ok) {
+          throw new Error(data.detail || 'Failed to load products');
+        }
+        allProducts = allProducts.concat(data.products || []);
+        cursor = data.next_cursor;
+      } while (cursor);
+      data = { ...data, products: allProducts };
       
       if (data.success && data.products) {
         console.log(`Loaded ${data.products.length} products:`, data.products.map(p => ({ id: p.id, name: p.name })));
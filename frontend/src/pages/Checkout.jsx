@@ -165,7 +165,9 @@ const Checkout = () => {
       // Prepare headers (authentication required)
       const headers = {
         'Content-Type': 'application/json',
-        'Authorization': `Bearer ${token}`
+        'Authorization': `Bearer ${token}`,
+        // One key per payment, so a retried verify replays instead of re-running
+        'Idempotency-Key': `verify-${razorpayResponse.razorpay_payment_id}`
       };
       
       // Verify payment with backend
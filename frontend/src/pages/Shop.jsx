@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import ProductCard from '../components/ProductCard';
 import { ScrollReveal } from '../hooks/useScrollReveal';
 import { Loader2, Ghost } from 'lucide-react';
-import { cachedFetch } from '../lib/apiCache';
+import { cachedFetchAll } from '../lib/apiCache';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL ||
   (process.env.NODE_ENV === 'production' ? '/api' : 'http://localhost:8000/api');
@@ -19,7 +19,7 @@ const Shop = () => {
     const fetchProducts = async () => {
       try {
         setLoading(true);
-        const data = await cachedFetch(`${BACKEND_URL}/products`);
+        const data = await cachedFetchAll(`${BACKEND_URL}/products?limit=200`);
         const transformedProducts = data.map(product => ({
           ...product,
           image: product.image_url || product.image
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.run import BENCH_ENV  # noqa: E402
+
+# Fixed settings (as for the benchmarks) so backend/.env is never used
+os.environ.update(BENCH_ENV)
+os.environ["WEBHOOK_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(), "webhooks.sqlite3")
+
+
+class Api:
+    """The real app on the in-process Supabase and Razorpay fakes"""
+
+    def __init__(self):
+        import httpx
+        import database
+        import payments
+        from benchmarks.fake_services import FakeRazorpayClient, FakeSupabase, FakeSupabaseTransport, seed
+
+        self.fake = FakeSupabase()
+        seed(self.fake, products=5, users=2, orders_per_user=1)
+        database.init_supabase(transport=FakeSupabaseTransport(self.fake, rtt=0))
+        self.razorpay = payments._client = FakeRazorpayClient(rtt=0)
+
+        import server
+        from auth_middleware import verify_jwt
+
+        self.app = server.app
+        self.user_id = None
+        self.app.dependency_overrides[verify_jwt] = lambda: self.user_id
+        self._httpx = httpx
+
+    def client(self):
+        transport = self._httpx.ASGITransport(app=self.app)
+        return self._httpx.AsyncClient(transport=transport, base_url="http://test")
+
+    def row(self, table: str, **match) -> dict:
+        return next(r for r in self.fake.tables[table] if all(r.get(k) == v for k, v in match.items()))
+
+
+@pytest.fixture
+def api():
+    api = Api()
+    yield api
+    api.app.dependency_overrides.clear()
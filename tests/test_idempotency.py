@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import idempotency
+
+
+class RacingStore:
+    """Table-store stand-in: the key is completed by another worker between get and claim"""
+
+    def __init__(self, fingerprint: str, response: dict):
+        self.record = {"status": "completed", "fingerprint": fingerprint, "response": response}
+        self.claimed = asyncio.Event()
+        self.proceed = asyncio.Event()
+        self.gets = 0
+
+    async def get(self, key):
+        self.gets += 1
+        return None if self.gets == 1 else self.record
+
+    async def claim(self, key, fingerprint):
+        self.claimed.set()
+        await self.proceed.wait()
+        return False
+
+
+def test_fingerprint_mismatch_is_not_shared_with_waiters(monkeypatch):
+    payload = {"order_id": "o1"}
+
+    async def scenario():
+        store = RacingStore(idempotency.request_fingerprint(payload), {"success": True})
+        monkeypatch.setattr(idempotency, "get_idempotency_store", lambda db: store)
+
+        async def handler():
+            raise AssertionError("handler must not run")
+
+        mismatched = asyncio.create_task(
+            idempotency.run_idempotent(None, "u1:verify", "key-1", {"order_id": "other"}, handler)
+        )
+        await store.claimed.wait()
+        matching = asyncio.create_task(idempotency.run_idempotent(None, "u1:verify", "key-1", payload, handler))
+        await asyncio.sleep(0)
+        store.proceed.set()
+        with pytest.raises(HTTPException) as error:
+            await mismatched
+        return error.value.status_code, await matching
+
+    status_code, result = asyncio.run(scenario())
+    assert status_code == 422
+    assert result == ({"success": True}, True)
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import payments
+from benchmarks.fake_services import bench_user_id
+
+
+def _reject_signature(params: dict) -> bool:
+    raise ValueError("Razorpay Signature Verification Failed")
+
+
+async def _checkout(client, product_id: str) -> str:
+    items = [{"product_id": product_id, "quantity": 1, "size": "M", "color": "black"}]
+    response = await client.post("/api/payments/create-order", json={"amount": 0, "items": items})
+    assert response.status_code == 200, response.text
+    return response.json()["order_id"]
+
+
+def _verify_body(order_id: str, payment_id: str) -> dict:
+    return {
+        "razorpay_order_id": "order_test",
+        "razorpay_payment_id": payment_id,
+        "razorpay_signature": "signature",
+        "order_id": order_id,
+    }
+
+
+def test_bad_signature_does_not_undo_a_paid_order(api):
+    api.user_id = bench_user_id(0)
+
+    async def scenario():
+        async with api.client() as client:
+            order_id = await _checkout(client, "prod-0000")
+            response = await client.post("/api/payments/verify", json=_verify_body(order_id, "pay_real"))
+            assert response.json()["success"] is True
+
+            api.razorpay.utility.verify_payment_signature = _reject_signature
+            response = await client.post("/api/payments/verify", json=_verify_body(order_id, "pay_forged"))
+            assert response.status_code == 200
+            assert response.json()["success"] is False
+            return order_id
+
+    order_id = asyncio.run(scenario())
+    order = api.row("orders", id=order_id)
+    assert (order["status"], order["payment_status"], order["payment_id"]) == ("completed", "paid", "pay_real")
+    assert order["stock_released"] is False
+    assert api.row("products", id="prod-0000")["stock_quantity"] == 999_999
+
+
+def test_bad_signature_releases_an_unpaid_order(api):
+    api.user_id = bench_user_id(0)
+    api.razorpay.utility.verify_payment_signature = _reject_signature
+
+    async def scenario():
+        async with api.client() as client:
+            order_id = await _checkout(client, "prod-0001")
+            response = await client.post("/api/payments/verify", json=_verify_body(order_id, "pay_forged"))
+            assert response.json()["success"] is False
+            return order_id
+
+    order_id = asyncio.run(scenario())
+    order = api.row("orders", id=order_id)
+    assert order["payment_status"] == "failed"
+    assert order["payment_id"] != "pay_forged"
+    assert order["stock_released"] is True
+    assert api.row("products", id="prod-0001")["stock_quantity"] == 1_000_000
+
+
+def test_bad_signature_on_another_users_order_is_not_found(api):
+    async def scenario():
+        async with api.client() as client:
+            api.user_id = bench_user_id(0)
+            order_id = await _checkout(client, "prod-0002")
+            api.user_id = bench_user_id(1)
+            api.razorpay.utility.verify_payment_signature = _reject_signature
+            response = await client.post("/api/payments/verify", json=_verify_body(order_id, "pay_forged"))
+            assert response.status_code == 404
+            return order_id
+
+    order_id = asyncio.run(scenario())
+    assert api.row("orders", id=order_id)["payment_status"] == "pending"
+
+
+def test_cancelled_trial_call_does_not_wedge_the_breaker(monkeypatch):
+    breaker = payments.CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    monkeypatch.setattr(payments, "razorpay_breaker", breaker)
+
+    class SlowOrders:
+        def create(self, data, timeout=None):
+            time.sleep(0.2)
+            return {"id": "order_slow"}
+
+    class SlowClient:
+        order = SlowOrders()
+
+    monkeypatch.setattr(payments, "get_razorpay_client", lambda: SlowClient())
+
+    async def scenario():
+        task = asyncio.create_task(payments.create_gateway_order({"amount": 100}))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(scenario())
+    assert breaker.state == "half_open"
+    assert breaker.allow()
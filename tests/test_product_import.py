@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from product_import import ImportFormatError, parse_csv, parse_ndjson
+
+
+async def _chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _parse(parser, data: bytes, chunk_size: int = 7):
+    async def collect():
+        return [record async for record in parser(_chunks(data, chunk_size))]
+    return asyncio.run(collect())
+
+
+def test_bare_quote_in_unquoted_field_is_literal():
+    data = b'id,name\np1,12" record\np2,Plain\np3,Other\n'
+    records = _parse(parse_csv, data)
+    assert records == [
+        (1, {"id": "p1", "name": '12" record'}),
+        (2, {"id": "p2", "name": "Plain"}),
+        (3, {"id": "p3", "name": "Other"}),
+    ]
+
+
+def test_quoted_field_spans_lines_and_chunks():
+    data = b'id,description\r\np1,"first line\r\nsecond, line"\r\np2,"say ""hi"""\r\n'
+    for chunk_size in (1, 3, 64):
+        records = _parse(parse_csv, data, chunk_size)
+        assert records == [
+            (1, {"id": "p1", "description": "first line\nsecond, line"}),
+            (2, {"id": "p2", "description": 'say "hi"'}),
+        ]
+
+
+def test_multibyte_character_split_across_chunks():
+    data = "﻿id,name\np1,Café ☕\n".encode()
+    assert _parse(parse_csv, data, chunk_size=1) == [(1, {"id": "p1", "name": "Café ☕"})]
+
+
+def test_list_and_json_columns_converted_and_empty_cells_dropped():
+    data = b'id,sizes,colors,image_variants,description\np1,S|M| L,,"{""thumb"":""t.webp""}",\n'
+    assert _parse(parse_csv, data) == [
+        (1, {"id": "p1", "sizes": ["S", "M", "L"], "colors": [], "image_variants": {"thumb": "t.webp"}}),
+    ]
+
+
+def test_row_errors_are_reported_per_row():
+    data = b'id,name,image_variants\np1,A\np2,B,{bad\n\np3,"open\n'
+    records = _parse(parse_csv, data)
+    assert [number for number, _ in records] == [1, 2, 3]
+    assert all(isinstance(record, ValueError) for _, record in records)
+    assert "Expected 3 columns, got 2" in str(records[0][1])
+    assert "Invalid JSON" in str(records[1][1])
+    assert "Unterminated quoted field" in str(records[2][1])
+
+
+def test_header_without_id_is_rejected():
+    with pytest.raises(ImportFormatError):
+        _parse(parse_csv, b"name,price\nA,1\n")
+
+
+def test_ndjson_skips_blank_lines_and_reports_bad_json():
+    data = b'{"id": "p1"}\n\n{bad\n{"id": "p2"}'
+    records = _parse(parse_ndjson, data)
+    assert records[0] == (1, {"id": "p1"})
+    assert records[1][0] == 2 and isinstance(records[1][1], ValueError)
+    assert records[2] == (3, {"id": "p2"})
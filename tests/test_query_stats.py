@@ -0,0 +1,17 @@
+from query_stats import QueryStats
+
+
+def _stats(*operations: str) -> QueryStats:
+    stats = QueryStats()
+    stats.calls = [(operation, 0.001) for operation in operations]
+    return stats
+
+
+def test_select_before_update_is_flagged():
+    stats = _stats("GET products", "PATCH products", "GET orders")
+    assert stats.repeated_tables(2) == {"products": 2}
+
+
+def test_idempotency_store_calls_are_exempt():
+    stats = _stats("GET idempotency_keys", "POST idempotency_keys", "PATCH idempotency_keys", "PATCH orders")
+    assert stats.repeated_tables(2) == {}
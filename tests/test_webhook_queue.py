@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+import webhook_queue
+from config import get_settings
+
+
+def _event(payment_id: str, event: str = "payment.captured") -> bytes:
+    return json.dumps({
+        "event": event,
+        "payload": {"payment": {"entity": {"id": payment_id, "order_id": f"order_{payment_id}"}}},
+    }).encode()
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = webhook_queue.WebhookQueue(str(tmp_path / "webhooks.sqlite3"))
+    monkeypatch.setattr(webhook_queue, "webhook_queue", queue)
+    return queue
+
+
+def test_poison_event_only_uses_its_own_attempts(queue, monkeypatch):
+    applied = []
+
+    async def apply_events(db, events):
+        refs = [event["payload"]["payment"]["entity"]["id"] for event in events]
+        if "pay_poison" in refs:
+            raise RuntimeError("bad event")
+        applied.extend(refs)
+        return {"paid": len(refs), "failed": 0}
+
+    monkeypatch.setattr(webhook_queue, "apply_events", apply_events)
+
+    async def scenario():
+        for payment_id in ("pay_a", "pay_poison", "pay_b"):
+            await webhook_queue.enqueue_event(payment_id, _event(payment_id))
+        return await webhook_queue.drain_queue(db=None)
+
+    report = asyncio.run(scenario())
+    assert sorted(applied) == ["pay_a", "pay_b"]
+    assert report == {"events": 2, "paid": 2, "failed": 0, "errors": 1}
+    assert queue.is_processed("pay_a") and queue.is_processed("pay_b")
+    assert queue.stats() == {"pending": 1, "processed": 2, "dead": 0}
+
+
+def test_redelivery_revives_a_dead_event(queue):
+    max_attempts = get_settings().webhook_max_attempts
+    assert queue.enqueue("evt_1", "payment.captured", "{}")
+    for _ in range(max_attempts):
+        queue.mark_failed(["evt_1"], "boom")
+    assert queue.next_batch(10) == []
+    assert queue.stats()["dead"] == 1
+
+    assert not queue.enqueue("evt_1", "payment.captured", "{}")
+    assert [event_id for event_id, _ in queue.next_batch(10)] == ["evt_1"]
+
+
+def test_serverless_webhook_succeeds_on_redelivery_after_attempts_run_out(api, monkeypatch):
+    monkeypatch.setattr(get_settings(), "razorpay_webhook_allow_unsigned", True)
+    real_apply_events = webhook_queue.apply_events
+
+    async def failing_apply_events(db, events):
+        raise RuntimeError("database unavailable")
+
+    async def scenario():
+        body = _event("pay_redelivered")
+        headers = {"X-Razorpay-Event-Id": "evt_redelivered"}
+        async with api.client() as client:
+            monkeypatch.setattr(webhook_queue, "apply_events", failing_apply_events)
+            for _ in range(get_settings().webhook_max_attempts + 1):
+                response = await client.post("/api/payments/webhook", content=body, headers=headers)
+                assert response.status_code == 500
+            monkeypatch.setattr(webhook_queue, "apply_events", real_apply_events)
+            return await client.post("/api/payments/webhook", content=body, headers=headers)
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.json()["status"] == "processed"